@@ -0,0 +1,8 @@
+# Picked up automatically by gunicorn from the working directory (see Procfile)
+import threading
+
+
+def post_worker_init(worker):
+    """Warm each worker's HTTP pools off the request path so the first webhook isn't cold"""
+    from main import warm_up
+    threading.Thread(target=warm_up, name="gutinvoice-warmup", daemon=True).start()
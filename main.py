@@ -2,21 +2,31 @@
 GutInvoice — Every Invoice has a Voice
 v16.1 — FIXED: TwiML responses | Threading | Hi greeting | Supabase resilience
 ===================================================================================
-SINGLE FILE — no pdf_generators.py needed.
+PDF layouts live in pdfs.py (imported on its own by the render processes).
 
 ALL PDF FORMATS UNCHANGED from v16.
 FIXES IN v16.1:
   ✅ TwiML used for all text responses (works even if Twilio REST API fails)
-  ✅ Background threading for voice note processing (no webhook timeout)
+  ✅ Background thread pool for voice note processing (no webhook timeout)
   ✅ "Hi / Hello / Hey" greeting handler restored (shows full menu)
   ✅ Supabase errors non-fatal — never cause silent failure
   ✅ Error handler always returns TwiML (user ALWAYS gets a response)
   ✅ save_invoice gracefully skips unknown columns
 
+RUN (production): see Procfile — gunicorn with gthread workers (2 x 16 threads);
+  gunicorn.conf.py warms each worker's HTTP pools on boot
+
 SAME ENV VARS AS v16:
   TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER
   SARVAM_API_KEY, CLAUDE_API_KEY (or ANTHROPIC_API_KEY)
   SUPABASE_URL, SUPABASE_KEY
+OPTIONAL:
+  PDF_PROCESSES — PDF render processes per worker (default 2; 0 = render in-thread;
+                  python main.py always renders in-thread)
+  PDF_DELIVERY  — "attachment" (default) or "link" (PDF URL in the message text)
+  WORKER_THREADS   — background job threads per worker (default 32)
+  MAX_PENDING_JOBS — queued + running jobs before new ones get a "busy" reply
+                     (default 4 x WORKER_THREADS)
 
 SUPABASE SQL (run once if new columns missing):
   ALTER TABLE invoices ADD COLUMN IF NOT EXISTS is_cancelled BOOLEAN DEFAULT FALSE;
@@ -34,24 +44,39 @@ SUPABASE SQL (run once if new columns missing):
 # ═══════════════════════════════════════════════════════════════════════════════
 # IMPORTS
 # ═══════════════════════════════════════════════════════════════════════════════
-import os, io, json, logging, re, requests, threading
+import os, io, atexit, base64, gzip, hashlib, logging, multiprocessing, queue, re, requests, threading, time
+from functools import lru_cache, wraps
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from types import MappingProxyType
 from urllib.parse import quote as url_quote
+from requests.adapters import HTTPAdapter
+from cachetools import TTLCache
+from urllib3.util.retry import Retry
 from datetime import datetime
-from flask import Flask, request, Response, render_template_string
+from flask import Flask, request, Response
 from twilio.rest import Client as TwilioClient
+from twilio.http.http_client import TwilioHttpClient
 from twilio.twiml.messaging_response import MessagingResponse
-import anthropic
-
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import mm
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
-from reportlab.platypus import (
-    SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, HRFlowable
-)
-
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+import anthropic, httpx, orjson
+
+from pdfs import PDF_BUILDERS, fmt, is_interstate, render as _render_pdf
+
+class _DeferredQueueHandler(QueueHandler):
+    """Enqueue the record untouched — message and traceback formatting happen on the listener thread"""
+    def prepare(self, record):
+        return record
+
+# Request threads only enqueue log records; one listener thread formats them
+# and writes to stderr, so a slow log sink never stalls a webhook.
+_LOG_QUEUE   = queue.SimpleQueue()
+_LOG_STREAM  = logging.StreamHandler()
+_LOG_STREAM.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+LOG_LISTENER = QueueListener(_LOG_QUEUE, _LOG_STREAM)
+logging.basicConfig(level=logging.INFO, handlers=[_DeferredQueueHandler(_LOG_QUEUE)])
+LOG_LISTENER.start()
+atexit.register(LOG_LISTENER.stop)   # flush what's queued on shutdown
 log = logging.getLogger(__name__)
 app = Flask(__name__)
 
@@ -63,892 +88,499 @@ app = Flask(__name__)
 def env(key, default=""):
     return os.environ.get(key, default)
 
+# Config is fixed for the life of the process — snapshot it once at import
+# (read-only), so /health, /debug and the hot paths never touch os.environ
+REQUIRED_ENV = ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_FROM_NUMBER",
+                "SARVAM_API_KEY", "SUPABASE_URL", "SUPABASE_KEY", "CLAUDE_API_KEY")
+CONFIG = MappingProxyType({
+    **{k: env(k) for k in REQUIRED_ENV},
+    "CLAUDE_API_KEY": env("CLAUDE_API_KEY") or env("ANTHROPIC_API_KEY"),
+})
+TWILIO_SID     = CONFIG["TWILIO_ACCOUNT_SID"]
+TWILIO_TOKEN   = CONFIG["TWILIO_AUTH_TOKEN"]
+TWILIO_FROM    = CONFIG["TWILIO_FROM_NUMBER"]
+SARVAM_API_KEY = CONFIG["SARVAM_API_KEY"]
+SUPABASE_URL   = CONFIG["SUPABASE_URL"]
+SUPABASE_KEY   = CONFIG["SUPABASE_KEY"]
+CLAUDE_API_KEY = CONFIG["CLAUDE_API_KEY"]
+
+# One keep-alive session for Supabase, Sarvam, Twilio media + Twilio REST
+# — TLS handshakes are paid once per worker, not once per call.
+# Pool is sized for the background thread pools (up to ~16 concurrent calls
+# per host); idempotent requests retry on dropped connections and on
+# transient gateway errors from Supabase's pooler.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=20, pool_maxsize=50,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504],
+                      raise_on_status=False),
+))
+
+# Fan-out pool for independent I/O inside a background job (lookups that can
+# overlap). Kept separate from EXECUTOR so a job waiting on these futures can
+# never starve the pool that would run them.
+IO_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="gutinvoice-io")
+
+def _singleton(factory):
+    """Build once per process; the lock keeps a first-request burst from racing
+    several clients (and connection pools) into existence. Failures aren't cached."""
+    lock, box = threading.Lock(), []
+    @wraps(factory)
+    def get():
+        if not box:
+            with lock:
+                if not box:
+                    box.append(factory())
+        return box[0]
+    return get
+
+@_singleton
 def get_twilio():
-    return TwilioClient(env("TWILIO_ACCOUNT_SID"), env("TWILIO_AUTH_TOKEN"))
+    """One Twilio client per worker — rides on the shared keep-alive SESSION"""
+    http = TwilioHttpClient(pool_connections=True)
+    http.session = SESSION
+    return TwilioClient(TWILIO_SID, TWILIO_TOKEN, http_client=http)
 
+@_singleton
 def get_claude():
-    return anthropic.Anthropic(api_key=env("CLAUDE_API_KEY") or env("ANTHROPIC_API_KEY"))
+    """One Anthropic client per worker — reuses keep-alive connections across calls"""
+    return anthropic.Anthropic(
+        api_key=CLAUDE_API_KEY,
+        http_client=anthropic.DefaultHttpxClient(
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40)),
+    )
 
 def safe_json(response, label):
-    """Parse JSON — returns None on failure (never raises)"""
-    raw = (response.text or "").strip()
-    log.info(f"[{label}] HTTP {response.status_code} | {raw[:120]}")
+    """Parse JSON with orjson straight from the body bytes — returns None on failure (never raises)"""
+    raw = (response.content or b"").strip()
+    log.info("[%s] HTTP %s | %s", label, response.status_code, raw[:120].decode("utf-8", "replace"))
     if not raw:
-        log.warning(f"[{label}] empty response")
+        log.warning("[%s] empty response", label)
         return None
     try:
-        return json.loads(raw)
-    except Exception:
-        log.warning(f"[{label}] non-JSON: {raw[:120]}")
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        log.warning("[%s] non-JSON: %s", label, raw[:120].decode("utf-8", "replace"))
         return None
 
-def fmt(val):
-    try:   return f"{float(val):,.2f}"
-    except: return "0.00"
-
-def fmt_i(val):
-    try:
-        v = float(val)
-        return str(int(v)) if v == int(v) else str(v)
-    except: return "0"
-
 # ═══════════════════════════════════════════════════════════════════════════════
 # TWIML + REST HELPERS  ← KEY FIX: TwiML needs no credentials, always works
 # ═══════════════════════════════════════════════════════════════════════════════
 
+TWIML_HEADERS = {"Content-Type": "text/xml"}
+
+@lru_cache(maxsize=1024)
 def twiml_reply(text):
-    """HTTP response back to Twilio — most reliable, no REST API credentials needed"""
+    """
+    HTTP response back to Twilio — most reliable, no REST API credentials needed.
+    Almost every reply is one of a few fixed texts per language, so the
+    serialised TwiML is memoised by text (the tuple is never mutated).
+    """
     r = MessagingResponse()
     r.message(str(text))
-    return str(r), 200, {"Content-Type": "text/xml"}
+    return str(r), 200, TWIML_HEADERS
+
+# Replies that never change are serialised to TwiML once at import
+EMPTY_TWIML   = (str(MessagingResponse()), 200, TWIML_HEADERS)
+WELCOME_TEXT  = ("Welcome to *GutInvoice* 🎙️\n_Every Invoice has a Voice_\n\n"
+                 "Choose your language:\n1️⃣ English\n2️⃣ Telugu / తెలుగు")
+WELCOME_TWIML = twiml_reply(WELCOME_TEXT)
 
 def twiml_empty():
     """Empty TwiML — real response sent via send_rest() in background"""
-    return str(MessagingResponse()), 200, {"Content-Type": "text/xml"}
+    return EMPTY_TWIML
 
 def send_rest(to, body, pdf_url=None):
+    """Queue a message for the outbox worker — never blocks the caller on Twilio"""
+    try:
+        OUTBOX.put({"to": to, "body": str(body), "pdf_url": pdf_url}, timeout=5)
+        return True
+    except queue.Full:
+        log.error("Outbox full — dropped message → %s", to)
+        return False
+
+# "attachment" (default) has Twilio fetch the PDF from storage and attach it;
+# "link" puts the public URL in the message text instead — no media fetch on
+# Twilio's side, so no attach latency and no attach-failure fallback.
+PDF_DELIVERY = env("PDF_DELIVERY", "attachment").lower()
+
+def _deliver(to, body, pdf_url=None):
     """Send via Twilio REST API — only required when attaching a PDF"""
+    if pdf_url and PDF_DELIVERY == "link":
+        body, pdf_url = str(body) + f"\n\n📎 PDF: {pdf_url}", None
     try:
-        kw = {"from_": env("TWILIO_FROM_NUMBER"), "to": to, "body": str(body)}
+        kw = {"from_": TWILIO_FROM, "to": to, "body": str(body)}
         if pdf_url:
             kw["media_url"] = [pdf_url]
         get_twilio().messages.create(**kw)
-        log.info(f"REST send OK → {to}")
+        log.info("REST send OK → %s", to)
         return True
     except Exception as e:
-        log.error(f"REST send FAILED → {to}: {e}")
+        log.error("REST send FAILED → %s: %s", to, e)
         if pdf_url:
             try:
                 get_twilio().messages.create(
-                    from_=env("TWILIO_FROM_NUMBER"), to=to,
+                    from_=TWILIO_FROM, to=to,
                     body=str(body) + f"\n\n📎 PDF: {pdf_url}"
                 )
             except Exception as e2:
-                log.error(f"REST fallback also failed: {e2}")
+                log.error("REST fallback also failed: %s", e2)
         return False
 
-# ═══════════════════════════════════════════════════════════════════════════════
-# PDF BUILDERS
-# ═══════════════════════════════════════════════════════════════════════════════
-
-def env(key, default=""):
-    return os.environ.get(key, default)
-
-def get_twilio():
-    return TwilioClient(env("TWILIO_ACCOUNT_SID"), env("TWILIO_AUTH_TOKEN"))
-
-def get_claude():
-    api_key = env("CLAUDE_API_KEY") or env("ANTHROPIC_API_KEY")
-    return anthropic.Anthropic(api_key=api_key)
-
-def safe_json(response, label):
-    raw = response.text.strip()
-    log.info(f"[{label}] HTTP {response.status_code} | {raw[:200]}")
-    if not raw:
-        raise Exception(f"{label} empty response (HTTP {response.status_code})")
-    try:
-        return json.loads(raw)
-    except json.JSONDecodeError as e:
-        raise Exception(f"{label} non-JSON (HTTP {response.status_code}): {raw[:200]} | {e}")
-
-def fmt(val):
-    try:
-        return f"{float(val):,.2f}"
-    except Exception:
-        return "0.00"
-
-def fmt_i(val):
-    try:
-        v = float(val)
-        return str(int(v)) if v == int(v) else str(v)
-    except Exception:
-        return "0"
-
-# ═══════════════════════════════════════════════════════════════════════════════
-# PDF STYLES & CONSTANTS
-# ═══════════════════════════════════════════════════════════════════════════════
-
-M      = 15 * mm
-PAGE_W = A4[0] - 2 * M
-TEAL   = colors.HexColor("#006B6B")
-ORANGE = colors.HexColor("#FF6B35")
-DARK   = colors.HexColor("#1A1A2E")
-LGRAY  = colors.HexColor("#F5F5F5")
-RED    = colors.HexColor("#CC0000")
-WHITE  = colors.white
-SS     = getSampleStyleSheet()
-
-def _s(name, **kw):
-    return ParagraphStyle(name=name, parent=SS["Normal"], **kw)
-
-ST = {
-    "doc_title": _s("doc_title", fontSize=15, fontName="Helvetica-Bold",
-                    textColor=WHITE, alignment=TA_CENTER),
-    "sec_hdr":   _s("sec_hdr",  fontSize=8,  fontName="Helvetica-Bold",
-                    textColor=WHITE, alignment=TA_CENTER),
-    "body":      _s("body",     fontSize=8,  textColor=DARK, leading=12),
-    "body_b":    _s("body_b",   fontSize=8,  fontName="Helvetica-Bold", textColor=DARK),
-    "body_r":    _s("body_r",   fontSize=8,  textColor=DARK, alignment=TA_RIGHT, leading=12),
-    "grand_l":   _s("grand_l",  fontSize=9,  fontName="Helvetica-Bold", textColor=DARK),
-    "grand_r":   _s("grand_r",  fontSize=9,  fontName="Helvetica-Bold", textColor=DARK,
-                    alignment=TA_RIGHT),
-    "th":        _s("th",       fontSize=8,  fontName="Helvetica-Bold",
-                    textColor=WHITE, alignment=TA_CENTER),
-    "td_c":      _s("td_c",     fontSize=8,  textColor=DARK, alignment=TA_CENTER, leading=11),
-    "td_l":      _s("td_l",     fontSize=8,  textColor=DARK, alignment=TA_LEFT,   leading=11),
-    "td_r":      _s("td_r",     fontSize=8,  textColor=DARK, alignment=TA_RIGHT,  leading=11),
-    "fn1":       _s("fn1",      fontSize=7,  textColor=WHITE, alignment=TA_CENTER, leading=10),
-    "fn2":       _s("fn2",      fontSize=6,  textColor=ORANGE, alignment=TA_CENTER,
-                    leading=9, fontName="Helvetica-Oblique"),
-    "red_b":     _s("red_b",    fontSize=8,  fontName="Helvetica-Bold", textColor=RED),
-    "red_r":     _s("red_r",    fontSize=8,  fontName="Helvetica-Bold", textColor=RED,
-                    alignment=TA_RIGHT),
-    "small_c":   _s("small_c",  fontSize=7,  textColor=colors.grey,
-                    alignment=TA_CENTER, leading=9),
-}
-
-def p(text, style="body"):
-    return Paragraph(str(text) if text is not None else "", ST[style])
+# ── OUTBOX: one worker drains queued messages in batches and fans them out
+#    over the shared keep-alive session. Messages to the same number stay
+#    in order; different numbers are sent in parallel. The queue is bounded
+#    so a Twilio outage applies backpressure instead of growing without limit.
+OUTBOX        = queue.Queue(maxsize=1000)
+OUTBOX_BATCH  = 20
+OUTBOX_WINDOW = 0.025   # seconds to wait for more messages to join a batch
+_SEND_POOL    = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gutinvoice-send")
+
+def _deliver_in_order(msgs):
+    for m in msgs:
+        _deliver(m["to"], m["body"], m["pdf_url"])
+
+def _outbox_worker():
+    while True:
+        batch    = [OUTBOX.get()]
+        deadline = time.monotonic() + OUTBOX_WINDOW
+        while len(batch) < OUTBOX_BATCH:
+            try:
+                batch.append(OUTBOX.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        by_to = {}
+        for m in batch:
+            by_to.setdefault(m["to"], []).append(m)
+        try:
+            futs = []
+            for msgs in by_to.values():
+                try:
+                    futs.append(_SEND_POOL.submit(_deliver_in_order, msgs))
+                except RuntimeError:   # interpreter exiting — pools take no new work
+                    _deliver_in_order(msgs)
+            for f in futs:
+                f.result()
+        except Exception as e:
+            log.error("Outbox batch failed: %s", e, exc_info=True)
+        finally:
+            for _ in batch:
+                OUTBOX.task_done()
 
-def sp(h=4):
-    return Spacer(1, h * mm)
+threading.Thread(target=_outbox_worker, name="gutinvoice-outbox", daemon=True).start()
 
-# ═══════════════════════════════════════════════════════════════════════════════
-# PDF SHARED COMPONENTS
-# ═══════════════════════════════════════════════════════════════════════════════
+OUTBOX_DRAIN_TIMEOUT = 20   # seconds a shutting-down worker waits for queued sends
 
-def doc_header(title):
-    """Full-width teal header — centered bold title"""
-    t = Table([[p(title, "doc_title")]], colWidths=[PAGE_W], rowHeights=[11 * mm])
-    t.setStyle(TableStyle([
-        ("BACKGROUND",    (0, 0), (-1, -1), TEAL),
-        ("VALIGN",        (0, 0), (-1, -1), "MIDDLE"),
-        ("TOPPADDING",    (0, 0), (-1, -1), 0),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
-    ]))
-    return t
-
-def _inner_box(rows, width):
-    t = Table(rows, colWidths=[width])
-    t.setStyle(TableStyle([
-        ("BACKGROUND",    (0, 0), (-1, 0), TEAL),
-        ("BACKGROUND",    (0, 1), (-1, -1), LGRAY),
-        ("TOPPADDING",    (0, 0), (-1, -1), 3),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
-        ("LEFTPADDING",   (0, 0), (-1, -1), 6),
-        ("RIGHTPADDING",  (0, 0), (-1, -1), 6),
-        ("BOX",           (0, 0), (-1, -1), 0.5, colors.lightgrey),
-        ("INNERGRID",     (0, 1), (-1, -1), 0.2, colors.lightgrey),
-    ]))
-    return t
-
-def seller_invoice_section(d, show_gstin=True, show_reverse=True,
-                            right_lbl="INVOICE DETAILS", no_lbl="Invoice No"):
-    """
-    Two-column block matching all docx templates:
-    Left  = SELLER DETAILS
-    Right = INVOICE DETAILS (or CREDIT NOTE DETAILS)
+def _drain_outbox():
     """
-    LW = PAGE_W * 0.52
-    RW = PAGE_W * 0.48
-
-    left_rows = [
-        [p("SELLER DETAILS", "sec_hdr")],
-        [p(f"<b>Business Name:</b> {d.get('seller_name','')}", "body")],
-        [p(f"<b>Address:</b> {d.get('seller_address','')}", "body")],
-    ]
-    if show_gstin:
-        left_rows.append([p(f"<b>GSTIN:</b> {d.get('seller_gstin','')}", "body")])
-
-    inv_date_lbl = "Credit Note Date" if "CREDIT" in right_lbl.upper() else "Invoice Date"
-    right_rows = [
-        [p(right_lbl, "sec_hdr")],
-        [p(f"<b>{no_lbl}:</b> {d.get('invoice_number','')}", "body")],
-        [p(f"<b>{inv_date_lbl}:</b> {d.get('invoice_date', datetime.now().strftime('%d/%m/%Y'))}", "body")],
-        [p(f"<b>Place of Supply:</b> {d.get('place_of_supply','')}", "body")],
-    ]
-    if show_reverse:
-        right_rows.append([p(f"<b>Reverse Charge:</b> {d.get('reverse_charge','No')}", "body")])
-
-    outer = Table(
-        [[_inner_box(left_rows, LW - 3), _inner_box(right_rows, RW - 3)]],
-        colWidths=[LW, RW]
-    )
-    outer.setStyle(TableStyle([
-        ("VALIGN",        (0, 0), (-1, -1), "TOP"),
-        ("LEFTPADDING",   (0, 0), (-1, -1), 0),
-        ("RIGHTPADDING",  (0, 0), (-1, -1), 0),
-        ("TOPPADDING",    (0, 0), (-1, -1), 0),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
-    ]))
-    return outer
-
-def bill_to_section(d, show_gstin=True):
-    """Full-width BILL TO box"""
-    rows = [
-        [p("BILL TO (CUSTOMER DETAILS)", "sec_hdr")],
-        [p(f"<b>Name:</b> {d.get('customer_name','')}", "body")],
-        [p(f"<b>Address:</b> {d.get('customer_address','')}", "body")],
-    ]
-    if show_gstin and d.get("customer_gstin"):
-        rows.append([p(f"<b>GSTIN:</b> {d.get('customer_gstin','')}", "body")])
-    t = Table(rows, colWidths=[PAGE_W])
-    t.setStyle(TableStyle([
-        ("BACKGROUND",    (0, 0), (-1, 0), TEAL),
-        ("BACKGROUND",    (0, 1), (-1, -1), LGRAY),
-        ("TOPPADDING",    (0, 0), (-1, -1), 3),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
-        ("LEFTPADDING",   (0, 0), (-1, -1), 6),
-        ("RIGHTPADDING",  (0, 0), (-1, -1), 6),
-        ("BOX",           (0, 0), (-1, -1), 0.5, colors.lightgrey),
-        ("INNERGRID",     (0, 1), (-1, -1), 0.2, colors.lightgrey),
-    ]))
-    return t
-
-def items_table_7col(items):
-    """
-    7-column items table matching all 3 docx templates:
-    # | Description | HSN/SAC | Qty | Unit | Rate (Rs.) | Amount (Rs.)
+    atexit: background jobs have already been joined by the time this runs, but
+    their replies may still be queued and the outbox thread is a daemon — give
+    it a bounded window to send them before the process goes.
     """
-    CW = [PAGE_W * w for w in [0.05, 0.33, 0.12, 0.08, 0.08, 0.16, 0.18]]
-    data = [[p("#","th"), p("Description","th"), p("HSN/SAC","th"),
-             p("Qty","th"), p("Unit","th"), p("Rate (Rs.)","th"), p("Amount (Rs.)","th")]]
-    for it in items:
-        data.append([
-            p(str(it.get("sno","1")),          "td_c"),
-            p(str(it.get("description","")),    "td_l"),
-            p(str(it.get("hsn_sac","")),        "td_c"),
-            p(fmt(it.get("qty", 0)),             "td_r"),
-            p(str(it.get("unit","Nos")),         "td_c"),
-            p(f"Rs. {fmt(it.get('rate',0))}",      "td_r"),
-            p(f"Rs. {fmt(it.get('amount',0))}",    "td_r"),
-        ])
-    t = Table(data, colWidths=CW, repeatRows=1)
-    t.setStyle(TableStyle([
-        ("BACKGROUND",    (0, 0), (-1, 0), TEAL),
-        ("ROWBACKGROUNDS",(0, 1), (-1, -1), [WHITE, LGRAY]),
-        ("BOX",           (0, 0), (-1, -1), 0.5, colors.lightgrey),
-        ("INNERGRID",     (0, 0), (-1, -1), 0.3, colors.lightgrey),
-        ("VALIGN",        (0, 0), (-1, -1), "MIDDLE"),
-        ("TOPPADDING",    (0, 0), (-1, -1), 3),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
-    ]))
-    return t
-
-def totals_box(rows):
-    """Right-aligned totals block with grand total highlighted"""
-    t = Table(rows, colWidths=[PAGE_W * 0.70, PAGE_W * 0.30])
-    t.setStyle(TableStyle([
-        ("TOPPADDING",    (0, 0), (-1, -1), 3),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
-        ("LEFTPADDING",   (0, 0), (-1, -1), 5),
-        ("RIGHTPADDING",  (0, 0), (-1, -1), 5),
-        ("ALIGN",         (1, 0), (1, -1), "RIGHT"),
-        ("LINEABOVE",     (0, -1), (-1, -1), 1.2, TEAL),
-        ("LINEBELOW",     (0, -1), (-1, -1), 1.5, TEAL),
-        ("BACKGROUND",    (0, -1), (-1, -1), LGRAY),
-    ]))
-    return t
-
-def declaration_two_col(declaration, payment_terms):
-    """Two-column DECLARATION | PAYMENT TERMS — used in Tax Invoice"""
-    t = Table(
-        [[p("<b>DECLARATION</b>", "body_b"), p("<b>PAYMENT TERMS</b>", "body_b")],
-         [p(declaration, "body"),            p(payment_terms, "body")]],
-        colWidths=[PAGE_W * 0.60, PAGE_W * 0.40]
-    )
-    t.setStyle(TableStyle([
-        ("BOX",           (0, 0), (-1, -1), 0.5, colors.lightgrey),
-        ("BACKGROUND",    (0, 0), (-1, 0), LGRAY),
-        ("INNERGRID",     (0, 0), (-1, -1), 0.3, colors.lightgrey),
-        ("TOPPADDING",    (0, 0), (-1, -1), 4),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
-        ("LEFTPADDING",   (0, 0), (-1, -1), 6),
-        ("VALIGN",        (0, 0), (-1, -1), "TOP"),
-    ]))
-    return t
-
-def declaration_single(title, declaration, payment_terms):
-    """Single-box declaration — used in Bill of Supply and Non-GST Invoice"""
-    t = Table(
-        [[p(title, "body_b")],
-         [p(declaration, "body")],
-         [p(f"<b>Payment Terms:</b> {payment_terms}", "body")]],
-        colWidths=[PAGE_W]
-    )
-    t.setStyle(TableStyle([
-        ("BOX",           (0, 0), (-1, -1), 0.5, colors.lightgrey),
-        ("BACKGROUND",    (0, 0), (-1, 0), LGRAY),
-        ("TOPPADDING",    (0, 0), (-1, -1), 4),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
-        ("LEFTPADDING",   (0, 0), (-1, -1), 6),
-    ]))
-    return t
-
-def signatory_block(seller_name):
-    """For {seller} / Authorised Signatory — right aligned"""
-    t1 = Table(
-        [[p(""), p(f"<b>For {seller_name}</b>", "body")]],
-        colWidths=[PAGE_W * 0.55, PAGE_W * 0.45]
-    )
-    t1.setStyle(TableStyle([
-        ("TOPPADDING",    (0, 0), (-1, -1), 14),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
-        ("ALIGN",         (1, 0), (1, 0), "RIGHT"),
-    ]))
-    t2 = Table(
-        [[p(""), p("Authorised Signatory", "body")]],
-        colWidths=[PAGE_W * 0.55, PAGE_W * 0.45]
-    )
-    t2.setStyle(TableStyle([
-        ("TOPPADDING",    (0, 0), (-1, -1), 2),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
-        ("ALIGN",         (1, 0), (1, 0), "RIGHT"),
-        ("LINEABOVE",     (1, 0), (1, 0), 0.5, colors.lightgrey),
-    ]))
-    return [t1, t2]
-
-def footer_elems():
-    t = Table(
-        [[p("Powered by GutInvoice, Every Invoice has a voice !!", "fn1")],
-         [p("Developed by Tallbag Advisory and Tech Solutions Private Limited  |  Contact: +91 7702424946", "fn1")],
-         [p("Disclaimer: Double check the Invoice details generated before sharing to anyone. GutInvoice is not responsible for any errors.", "fn2")]],
-        colWidths=[PAGE_W]
-    )
-    t.setStyle(TableStyle([
-        ("BACKGROUND",    (0, 0), (0, 1), TEAL),
-        ("BACKGROUND",    (0, 2), (0, 2), colors.HexColor("#FFF3EE")),
-        ("TOPPADDING",    (0, 0), (-1, -1), 3),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
-        ("BOX",           (0, 2), (-1, 2), 0.3, ORANGE),
-    ]))
-    return [sp(5), t]
-
-def num_words(amount):
-    ones = ["","One","Two","Three","Four","Five","Six","Seven","Eight","Nine",
-            "Ten","Eleven","Twelve","Thirteen","Fourteen","Fifteen","Sixteen",
-            "Seventeen","Eighteen","Nineteen"]
-    tens = ["","","Twenty","Thirty","Forty","Fifty","Sixty","Seventy","Eighty","Ninety"]
-    def _w(n):
-        if n < 20:    return ones[n]
-        elif n < 100: return tens[n//10] + (" " + ones[n%10] if n%10 else "")
-        elif n < 1000:  return ones[n//100]+" Hundred"+(" and "+_w(n%100) if n%100 else "")
-        elif n < 100000: return _w(n//1000)+" Thousand"+(" "+_w(n%1000) if n%1000 else "")
-        elif n < 10000000: return _w(n//100000)+" Lakh"+(" "+_w(n%100000) if n%100000 else "")
-        else: return _w(n//10000000)+" Crore"+(" "+_w(n%10000000) if n%10000000 else "")
-    try:
-        n = int(float(amount))
-        return "Zero Rupees Only" if n==0 else _w(n)+" Rupees Only"
-    except Exception:
-        return ""
-
-def _new_doc(buf):
-    return SimpleDocTemplate(buf, pagesize=A4,
-                             leftMargin=M, rightMargin=M,
-                             topMargin=M, bottomMargin=M)
-
-# ═══════════════════════════════════════════════════════════════════════════════
-# BUILDER 1: TAX INVOICE  (matches 438394e... docx template)
-# ═══════════════════════════════════════════════════════════════════════════════
-
-def build_tax_invoice(d: dict) -> bytes:
-    buf = io.BytesIO()
-    doc = _new_doc(buf)
-    el  = []
-
-    el.append(doc_header("TAX INVOICE"))
-    el.append(sp(2))
-    el.append(seller_invoice_section(d, show_gstin=True, show_reverse=True))
-    el.append(sp(2))
-    el.append(bill_to_section(d, show_gstin=True))
-    el.append(sp(3))
-    el.append(items_table_7col(d.get("items", [])))
-    el.append(sp(2))
-
-    cr  = float(d.get("cgst_rate", 0))
-    sr  = float(d.get("sgst_rate", 0))
-    ir  = float(d.get("igst_rate", 0))
-    inter = str(d.get("is_interstate","false")).lower() == "true"
-    tr = [[p("Taxable Value","body"), p(f"Rs. {fmt(d.get('taxable_value',0))}","body_r")]]
-    if inter:
-        tr.append([p(f"IGST @ {fmt_i(ir)}%","body"), p(f"Rs. {fmt(d.get('igst',0))}","body_r")])
-    else:
-        tr.append([p(f"CGST @ {fmt_i(cr)}%","body"), p(f"Rs. {fmt(d.get('cgst',0))}","body_r")])
-        tr.append([p(f"SGST @ {fmt_i(sr)}%","body"), p(f"Rs. {fmt(d.get('sgst',0))}","body_r")])
-    tr.append([p("GRAND TOTAL","grand_l"), p(f"Rs. {fmt(d.get('total_amount',0))}","grand_r")])
-    el.append(totals_box(tr))
-    el.append(sp(2))
-    el.append(p(f"<b>Amount in Words:</b> {num_words(d.get('total_amount',0))}", "body"))
-    el.append(sp(3))
-    el.append(declaration_two_col(
-        d.get("declaration","We declare that this invoice shows the actual price of the goods/services described and all particulars are true and correct."),
-        d.get("payment_terms","Pay within 30 days")
-    ))
-    el.append(sp(2))
-    el.extend(signatory_block(d.get("seller_name","")))
-    el.extend(footer_elems())
-    doc.build(el)
-    return buf.getvalue()
-
-# ═══════════════════════════════════════════════════════════════════════════════
-# BUILDER 2: BILL OF SUPPLY  (matches 84a93a7... docx template)
-# ═══════════════════════════════════════════════════════════════════════════════
-
-def build_bill_of_supply(d: dict) -> bytes:
-    buf = io.BytesIO()
-    doc = _new_doc(buf)
-    el  = []
-
-    el.append(doc_header("BILL OF SUPPLY"))
-    el.append(sp(2))
-    el.append(seller_invoice_section(d, show_gstin=True, show_reverse=True))
-    el.append(sp(2))
-    el.append(bill_to_section(d, show_gstin=False))   # No GSTIN for BOS customer
-    el.append(sp(3))
-    el.append(items_table_7col(d.get("items", [])))
-    el.append(sp(2))
-    tr = [
-        [p("Sub Total","body"),    p(f"Rs. {fmt(d.get('taxable_value',0))}","body_r")],
-        [p("GRAND TOTAL","grand_l"), p(f"Rs. {fmt(d.get('total_amount',0))}","grand_r")],
-    ]
-    el.append(totals_box(tr))
-    el.append(sp(2))
-    el.append(p(f"<b>Amount in Words:</b> {num_words(d.get('total_amount',0))}", "body"))
-    el.append(sp(3))
-    el.append(declaration_single(
-        "DECLARATION (MANDATORY FOR COMPOSITION DEALERS)",
-        d.get("declaration","Composition taxable person, not eligible to collect tax on supplies."),
-        d.get("payment_terms","Pay within 15 days")
-    ))
-    el.append(sp(2))
-    el.extend(signatory_block(d.get("seller_name","")))
-    el.extend(footer_elems())
-    doc.build(el)
-    return buf.getvalue()
-
-# ═══════════════════════════════════════════════════════════════════════════════
-# BUILDER 3: INVOICE (Non-GST)  (matches 94ecfd8... docx template)
-# ═══════════════════════════════════════════════════════════════════════════════
-
-def build_nongst_invoice(d: dict) -> bytes:
-    buf = io.BytesIO()
-    doc = _new_doc(buf)
-    el  = []
-
-    el.append(doc_header("INVOICE"))
-    el.append(sp(2))
-    el.append(seller_invoice_section(d, show_gstin=False, show_reverse=False))  # No GSTIN/RC
-    el.append(sp(2))
-    el.append(bill_to_section(d, show_gstin=False))
-    el.append(sp(3))
-    el.append(items_table_7col(d.get("items", [])))
-    el.append(sp(2))
-    tr = [
-        [p("Sub Total","body"),       p(f"Rs. {fmt(d.get('taxable_value',0))}","body_r")],
-        [p("TOTAL AMOUNT","grand_l"), p(f"Rs. {fmt(d.get('total_amount',0))}","grand_r")],
-    ]
-    el.append(totals_box(tr))
-    el.append(sp(2))
-    el.append(p(f"<b>Amount in Words:</b> {num_words(d.get('total_amount',0))}", "body"))
-    el.append(sp(3))
-    el.append(declaration_single(
-        "DECLARATION",
-        d.get("declaration","This is not a tax invoice. No GST has been charged."),
-        d.get("payment_terms","Pay within 30 days")
-    ))
-    el.append(sp(2))
-    el.extend(signatory_block(d.get("seller_name","")))
-    el.extend(footer_elems())
-    doc.build(el)
-    return buf.getvalue()
+    deadline = time.monotonic() + OUTBOX_DRAIN_TIMEOUT
+    while OUTBOX.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if OUTBOX.unfinished_tasks:
+        log.error("Shutting down with %d unsent messages", OUTBOX.unfinished_tasks)
 
-# ═══════════════════════════════════════════════════════════════════════════════
-# BUILDER 4: CREDIT NOTE  (matches sample_credit_note_v13.pdf)
-# ═══════════════════════════════════════════════════════════════════════════════
-
-def build_credit_note(d: dict) -> bytes:
-    buf = io.BytesIO()
-    doc = _new_doc(buf)
-    el  = []
-
-    el.append(doc_header("CREDIT NOTE"))
-    el.append(sp(2))
-
-    # Reference block (top summary — unique to credit notes)
-    cn_no     = d.get("invoice_number") or d.get("credit_note_number","")
-    cn_date   = d.get("invoice_date", datetime.now().strftime("%d/%m/%Y"))
-    orig_no   = d.get("original_invoice_number","")
-    orig_date = d.get("original_invoice_date","")
-    reason    = d.get("reason") or d.get("credit_reason","Cancellation of invoice as requested by seller")
-
-    ref = Table(
-        [[p(f"<b>Credit Note No:</b> {cn_no}",    "body"),
-          p(f"<b>Credit Note Date:</b> {cn_date}", "body")],
-         [p(f"<b>Against Invoice No:</b> {orig_no}",       "body"),
-          p(f"<b>Original Invoice Date:</b> {orig_date}",  "body")],
-         [p(f"<b>Reason:</b> {reason}", "body"), p("","body")]],
-        colWidths=[PAGE_W * 0.55, PAGE_W * 0.45]
-    )
-    ref.setStyle(TableStyle([
-        ("BOX",           (0, 0), (-1, -1), 0.8, TEAL),
-        ("BACKGROUND",    (0, 0), (-1, -1), colors.HexColor("#E8F5F5")),
-        ("INNERGRID",     (0, 0), (-1, -1), 0.2, colors.lightgrey),
-        ("TOPPADDING",    (0, 0), (-1, -1), 4),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
-        ("LEFTPADDING",   (0, 0), (-1, -1), 6),
-    ]))
-    el.append(ref)
-    el.append(sp(2))
-
-    el.append(seller_invoice_section(
-        d, show_gstin=True, show_reverse=False,
-        right_lbl="CREDIT NOTE DETAILS", no_lbl="Credit Note No"
-    ))
-    el.append(sp(2))
-    el.append(bill_to_section(d, show_gstin=True))
-    el.append(sp(3))
-    el.append(items_table_7col(d.get("items", [])))
-    el.append(sp(2))
-
-    cr    = float(d.get("cgst_rate", 0))
-    sr    = float(d.get("sgst_rate", 0))
-    ir    = float(d.get("igst_rate", 0))
-    inter = str(d.get("is_interstate","false")).lower() == "true"
-    tr    = [[p("Taxable Value Reversed","body"),
-              p(f"Rs. {fmt(d.get('taxable_value',0))}","body_r")]]
-    if inter:
-        tr.append([p(f"IGST @ {fmt_i(ir)}% (Reversed)","red_b"),
-                   p(f"(Rs. {fmt(d.get('igst',0))})","red_r")])
-    else:
-        tr.append([p(f"CGST @ {fmt_i(cr)}% (Reversed)","red_b"),
-                   p(f"(Rs. {fmt(d.get('cgst',0))})","red_r")])
-        tr.append([p(f"SGST @ {fmt_i(sr)}% (Reversed)","red_b"),
-                   p(f"(Rs. {fmt(d.get('sgst',0))})","red_r")])
-    tr.append([p("TOTAL CREDIT AMOUNT","grand_l"),
-               p(f"Rs. {fmt(d.get('total_amount',0))}","grand_r")])
-    el.append(totals_box(tr))
-    el.append(sp(2))
-    el.append(p(f"<b>Amount in Words:</b> {num_words(d.get('total_amount',0))}", "body"))
-    el.append(sp(3))
-
-    decl_text = d.get("declaration",
-        "This Credit Note cancels and fully reverses the above mentioned invoice. "
-        "The tax liability has been reduced accordingly. This document is valid for "
-        "GST credit note purposes under Section 34 of CGST Act 2017.")
-    decl_t = Table(
-        [[p("DECLARATION","body_b")],
-         [p(decl_text,"body")],
-         [p(f"<b>Original Invoice:</b> {orig_no}  |  <b>Reason:</b> {reason}","body")]],
-        colWidths=[PAGE_W]
-    )
-    decl_t.setStyle(TableStyle([
-        ("BOX",           (0, 0), (-1, -1), 0.5, colors.lightgrey),
-        ("BACKGROUND",    (0, 0), (-1, 0), LGRAY),
-        ("TOPPADDING",    (0, 0), (-1, -1), 4),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
-        ("LEFTPADDING",   (0, 0), (-1, -1), 6),
-    ]))
-    el.append(decl_t)
-    el.append(sp(2))
-    el.extend(signatory_block(d.get("seller_name","")))
-    el.extend(footer_elems())
-    doc.build(el)
-    return buf.getvalue()
-
-# ═══════════════════════════════════════════════════════════════════════════════
-# BUILDER 5: MONTHLY REPORT  (matches sample_monthly_report_v13.pdf)
-# 5 Sections + Final Tax Liability Summary
-# ═══════════════════════════════════════════════════════════════════════════════
-
-def build_monthly_report(rep: dict) -> bytes:
-    buf = io.BytesIO()
-    doc = _new_doc(buf)
-    el  = []
-
-    month = rep.get("report_month","")
-    year  = rep.get("report_year", datetime.now().year)
-    el.append(doc_header(f"Invoice & Tax Liability Report — {month} {year}"))
-    el.append(sp(2))
-
-    # Seller header line
-    sname  = rep.get("seller_name","")
-    sgstin = rep.get("seller_gstin","")
-    saddr  = rep.get("seller_address","")
-    gdate  = datetime.now().strftime("%d/%m/%Y")
-    el.append(Table(
-        [[p(f"<b>{sname}</b>  |  {saddr}","body"),
-          p(f"<b>GSTIN:</b> {sgstin}  |  <b>Generated:</b> {gdate}","body_r")]],
-        colWidths=[PAGE_W*0.6, PAGE_W*0.4]
-    ))
-    el.append(sp(2))
-
-    # KPI Summary box
-    s = rep.get("summary",{})
-    kpi = Table(
-        [[p("Total Invoices","sec_hdr"),
-          p("Total Taxable Value","sec_hdr"),
-          p("Total GST Payable","sec_hdr")],
-         [p(str(s.get("total_invoices",0)),"grand_l"),
-          p(f"Rs. {fmt(s.get('taxable_value',0))}","grand_l"),
-          p(f"Rs. {fmt(s.get('total_gst',0))}","grand_l")]],
-        colWidths=[PAGE_W/3]*3
-    )
-    kpi.setStyle(TableStyle([
-        ("BACKGROUND",    (0,0),(-1,0), TEAL),
-        ("BACKGROUND",    (0,1),(-1,1), LGRAY),
-        ("BOX",           (0,0),(-1,-1), 0.8, TEAL),
-        ("INNERGRID",     (0,0),(-1,-1), 0.5, colors.lightgrey),
-        ("TOPPADDING",    (0,0),(-1,-1), 5),
-        ("BOTTOMPADDING", (0,0),(-1,-1), 5),
-        ("LEFTPADDING",   (0,0),(-1,-1), 8),
-        ("VALIGN",        (0,0),(-1,-1), "MIDDLE"),
-    ]))
-    el.append(kpi)
-    el.append(sp(4))
-
-    # Reusable section renderer for A/B/C/E
-    def render_section(section_title, inv_list):
-        el.append(p(f"<b>{section_title}</b>","body_b"))
-        el.append(sp(1))
-        if not inv_list:
-            el.append(Table([[p("No invoices in this category.","body")]],
-                            colWidths=[PAGE_W]))
-            el.append(sp(3))
-            return
-        CW = [PAGE_W*w for w in [0.18,0.10,0.17,0.22,0.12,0.07,0.07,0.07]]
-        hdr = [p("Invoice No","th"), p("Date","th"), p("Customer","th"),
-               p("Description","th"), p("Taxable Rs.","th"),
-               p("CGST Rs.","th"),   p("SGST Rs.","th"), p("IGST Rs.","th")]
-        rows = [hdr]
-        tot = {"tax":0,"cgst":0,"sgst":0,"igst":0}
-        for inv in inv_list:
-            d_   = inv.get("_data",{})
-            desc = d_.get("items",[{}])[0].get("description","") if d_.get("items") else ""
-            rows.append([
-                p(inv.get("invoice_number",""),"td_l"),
-                p(inv.get("invoice_date",""),  "td_c"),
-                p(inv.get("customer_name",""), "td_l"),
-                p(desc,                        "td_l"),
-                p(fmt(inv.get("taxable_value",0)),"td_r"),
-                p(fmt(inv.get("cgst",0)),         "td_r"),
-                p(fmt(inv.get("sgst",0)),         "td_r"),
-                p(fmt(inv.get("igst",0)),         "td_r"),
-            ])
-            tot["tax"]  += float(inv.get("taxable_value",0))
-            tot["cgst"] += float(inv.get("cgst",0))
-            tot["sgst"] += float(inv.get("sgst",0))
-            tot["igst"] += float(inv.get("igst",0))
-        rows.append([
-            p(f"TOTAL ({len(inv_list)} invoices)","td_l"),
-            p("","td_c"),p("","td_l"),p("","td_l"),
-            p(fmt(tot["tax"]),"td_r"),
-            p(fmt(tot["cgst"]),"td_r"),
-            p(fmt(tot["sgst"]),"td_r"),
-            p(fmt(tot["igst"]),"td_r"),
-        ])
-        t = Table(rows, colWidths=CW, repeatRows=1)
-        t.setStyle(TableStyle([
-            ("BACKGROUND",    (0,0),(-1,0),  TEAL),
-            ("BACKGROUND",    (0,-1),(-1,-1), LGRAY),
-            ("ROWBACKGROUNDS",(0,1),(-1,-2), [WHITE, colors.HexColor("#F9F9F9")]),
-            ("BOX",           (0,0),(-1,-1),  0.5, colors.lightgrey),
-            ("INNERGRID",     (0,0),(-1,-1),  0.3, colors.lightgrey),
-            ("FONTNAME",      (0,-1),(-1,-1), "Helvetica-Bold"),
-            ("TOPPADDING",    (0,0),(-1,-1),  3),
-            ("BOTTOMPADDING", (0,0),(-1,-1),  3),
-            ("VALIGN",        (0,0),(-1,-1),  "MIDDLE"),
-        ]))
-        el.append(t)
-        el.append(sp(3))
-
-    render_section("SECTION A — TAX INVOICES (GST Registered)",      rep.get("tax_invoices",[]))
-    render_section("SECTION B — BILL OF SUPPLY (Composition / Exempt)", rep.get("bos_invoices",[]))
-    render_section("SECTION C — NON-GST INVOICES (Unregistered)",    rep.get("nongst_invoices",[]))
-
-    # Section D — HSN-WISE TAX SUMMARY
-    el.append(p("<b>SECTION D — HSN-WISE TAX SUMMARY</b>","body_b"))
-    el.append(sp(1))
-    hsn_list = rep.get("hsn_summary",[])
-    if hsn_list:
-        CW2 = [PAGE_W*w for w in [0.12,0.26,0.15,0.12,0.12,0.12,0.11]]
-        hdr2 = [p("HSN Code","th"), p("Description","th"), p("Taxable Rs.","th"),
-                p("CGST Rs.","th"), p("SGST Rs.","th"), p("IGST Rs.","th"),
-                p("Total Tax Rs.","th")]
-        rows2 = [hdr2]
-        gt = {"tax":0,"cgst":0,"sgst":0,"igst":0,"taxable":0}
-        for h in hsn_list:
-            ttax = float(h.get("cgst",0))+float(h.get("sgst",0))+float(h.get("igst",0))
-            rows2.append([
-                p(str(h.get("hsn","")),"td_c"),
-                p(str(h.get("description","")),"td_l"),
-                p(fmt(h.get("taxable",0)),"td_r"),
-                p(fmt(h.get("cgst",0)),"td_r"),
-                p(fmt(h.get("sgst",0)),"td_r"),
-                p(fmt(h.get("igst",0)),"td_r"),
-                p(fmt(ttax),"td_r"),
-            ])
-            gt["taxable"] += float(h.get("taxable",0))
-            gt["cgst"]    += float(h.get("cgst",0))
-            gt["sgst"]    += float(h.get("sgst",0))
-            gt["igst"]    += float(h.get("igst",0))
-            gt["tax"]     += ttax
-        rows2.append([
-            p("GRAND TOTAL","td_l"), p("","td_l"),
-            p(fmt(gt["taxable"]),"td_r"), p(fmt(gt["cgst"]),"td_r"),
-            p(fmt(gt["sgst"]),"td_r"),   p(fmt(gt["igst"]),"td_r"),
-            p(fmt(gt["tax"]),"td_r")
-        ])
-        ht = Table(rows2, colWidths=CW2, repeatRows=1)
-        ht.setStyle(TableStyle([
-            ("BACKGROUND",    (0,0),(-1,0),  TEAL),
-            ("BACKGROUND",    (0,-1),(-1,-1), LGRAY),
-            ("ROWBACKGROUNDS",(0,1),(-1,-2), [WHITE, colors.HexColor("#F9F9F9")]),
-            ("BOX",           (0,0),(-1,-1),  0.5, colors.lightgrey),
-            ("INNERGRID",     (0,0),(-1,-1),  0.3, colors.lightgrey),
-            ("FONTNAME",      (0,-1),(-1,-1), "Helvetica-Bold"),
-            ("TOPPADDING",    (0,0),(-1,-1),  3),
-            ("BOTTOMPADDING", (0,0),(-1,-1),  3),
-            ("VALIGN",        (0,0),(-1,-1),  "MIDDLE"),
-        ]))
-        el.append(ht)
-    else:
-        el.append(Table([[p("No HSN/SAC data available.","body")]],colWidths=[PAGE_W]))
-    el.append(sp(3))
-
-    render_section("SECTION E — CREDIT NOTES (Cancelled Invoices)", rep.get("credit_notes",[]))
-
-    # FINAL TAX LIABILITY SUMMARY
-    el.append(p("<b>FINAL TAX LIABILITY SUMMARY</b>","body_b"))
-    el.append(sp(1))
-    fs = rep.get("final_summary",{})
-    fs_rows = [
-        [p("Gross Taxable Value (all invoices)","body"),
-         p(f"Rs. {fmt(fs.get('gross_taxable',0))}","body_r")],
-        [p("Gross CGST Collected","body"),
-         p(f"Rs. {fmt(fs.get('gross_cgst',0))}","body_r")],
-        [p("Gross SGST Collected","body"),
-         p(f"Rs. {fmt(fs.get('gross_sgst',0))}","body_r")],
-        [p("Gross IGST Collected","body"),
-         p(f"Rs. {fmt(fs.get('gross_igst',0))}","body_r")],
-        [p("Less: CGST Reversed (Credit Notes)","red_b"),
-         p(f"(Rs. {fmt(fs.get('reversed_cgst',0))})","red_r")],
-        [p("Less: SGST Reversed (Credit Notes)","red_b"),
-         p(f"(Rs. {fmt(fs.get('reversed_sgst',0))})","red_r")],
-        [p("Less: IGST Reversed (Credit Notes)","red_b"),
-         p(f"(Rs. {fmt(fs.get('reversed_igst',0))})","red_r")],
-        [p("NET GST PAYABLE TO GOVERNMENT ★","grand_l"),
-         p(f"Rs. {fmt(fs.get('net_gst',0))}","grand_r")],
-    ]
-    ft = Table(fs_rows, colWidths=[PAGE_W*0.72, PAGE_W*0.28])
-    ft.setStyle(TableStyle([
-        ("BOX",           (0,0),(-1,-1), 0.8, TEAL),
-        ("BACKGROUND",    (0,-1),(-1,-1), colors.HexColor("#E8F5F5")),
-        ("LINEABOVE",     (0,-1),(-1,-1), 1.5, TEAL),
-        ("INNERGRID",     (0,0),(-1,-2), 0.3, colors.lightgrey),
-        ("TOPPADDING",    (0,0),(-1,-1), 4),
-        ("BOTTOMPADDING", (0,0),(-1,-1), 4),
-        ("LEFTPADDING",   (0,0),(-1,-1), 6),
-        ("RIGHTPADDING",  (0,0),(-1,-1), 6),
-        ("ALIGN",         (1,0),(1,-1),  "RIGHT"),
-    ]))
-    el.append(ft)
-    el.append(sp(3))
-    el.append(p("Use this report to prepare your GSTR-1 filing. "
-                "Verify all amounts with your Chartered Accountant before submission.","small_c"))
-    el.extend(footer_elems())
-    doc.build(el)
-    return buf.getvalue()
+atexit.register(_drain_outbox)
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # PDF ENTRY POINTS (with Supabase Storage upload)
 # ═══════════════════════════════════════════════════════════════════════════════
 
-def upload_pdf_to_supabase(pdf_bytes, file_path):
-    url = f"{env('SUPABASE_URL')}/storage/v1/object/invoices/{file_path}"
-    h   = {"apikey": env("SUPABASE_KEY"),
-           "Authorization": f"Bearer {env('SUPABASE_KEY')}",
+def upload_pdf_to_supabase(pdf, file_path):
+    """
+    pdf is a file-like (as returned by the builders) — streamed as the request body.
+    Don't pass buf.getbuffer(): requests treats a memoryview as an iterable and
+    would send it chunked, one int at a time. Files over TUS_CHUNK go via TUS.
+    """
+    pdf.seek(0, io.SEEK_END)
+    size = pdf.tell()
+    pdf.seek(0)
+    if size > TUS_CHUNK:
+        upload_pdf_tus(pdf, size, file_path)
+        return pdf_public_url(file_path)
+    url = f"{SUPABASE_URL}/storage/v1/object/invoices/{file_path}"
+    h   = {"apikey": SUPABASE_KEY,
+           "Authorization": f"Bearer {SUPABASE_KEY}",
            "Content-Type": "application/pdf",
            "x-upsert": "true"}
-    r = requests.post(url, headers=h, data=pdf_bytes, timeout=30)
+    r = SESSION.post(url, headers=h, data=pdf, timeout=30)
     if r.status_code not in (200, 201):
         raise Exception(f"Supabase upload {r.status_code}: {r.text[:200]}")
-    return f"{env('SUPABASE_URL')}/storage/v1/object/public/invoices/{file_path}"
+    return pdf_public_url(file_path)
+
+# Supabase Storage wants anything over 6 MB (big year-end reports) sent as a
+# TUS resumable upload, in fixed 6 MB chunks; a failed chunk is resumed from
+# the server's offset instead of restarting the whole file.
+TUS_CHUNK   = 6 * 1024 * 1024
+TUS_RETRIES = 3
+
+def _tus_meta(**kv):
+    return ",".join(f"{k} {base64.b64encode(v.encode()).decode()}" for k, v in kv.items())
+
+def upload_pdf_tus(pdf, size, file_path):
+    base = {"apikey": SUPABASE_KEY,
+            "Authorization": f"Bearer {SUPABASE_KEY}",
+            "Tus-Resumable": "1.0.0"}
+    r = SESSION.post(f"{SUPABASE_URL}/storage/v1/upload/resumable", timeout=10,
+                     headers={**base, "x-upsert": "true", "Upload-Length": str(size),
+                              "Upload-Metadata": _tus_meta(bucketName="invoices",
+                                                           objectName=file_path,
+                                                           contentType="application/pdf")})
+    if r.status_code != 201 or "Location" not in r.headers:
+        raise Exception(f"Supabase TUS create {r.status_code}: {r.text[:200]}")
+    loc, offset, fails = r.headers["Location"], 0, 0
+    while offset < size:
+        pdf.seek(offset)
+        try:
+            r = SESSION.patch(loc, data=pdf.read(TUS_CHUNK), timeout=30,
+                              headers={**base, "Upload-Offset": str(offset),
+                                       "Content-Type": "application/offset+octet-stream"})
+            if r.status_code == 204:
+                offset, fails = int(r.headers["Upload-Offset"]), 0
+                continue
+            err = f"{r.status_code}: {r.text[:200]}"
+        except requests.RequestException as e:
+            err = str(e)
+        fails += 1
+        if fails > TUS_RETRIES:
+            raise Exception(f"Supabase TUS upload at {offset}/{size}: {err}")
+        log.warning("⚠️ TUS chunk at %d failed (%s), resuming", offset, err)
+        h = SESSION.head(loc, headers=base, timeout=10)
+        if h.status_code == 200 and h.headers.get("Upload-Offset", "").isdigit():
+            offset = int(h.headers["Upload-Offset"])
+
+def pdf_public_url(file_path):
+    return f"{SUPABASE_URL}/storage/v1/object/public/invoices/{file_path}"
+
+# ReportLab layout is pure-Python CPU work that holds the GIL; rendering in a
+# small process pool keeps webhook threads responsive while invoices build.
+# Workers come from forkserver/spawn (forking a threaded gunicorn worker is
+# unsafe) and unpickle pdfs.render, so under gunicorn they import pdfs.py and
+# not this module. Run as a script (python main.py), though, each child would
+# re-execute this file as __mp_main__ — threads, pools, atexit hooks and all —
+# so the dev server renders in-thread. PDF_PROCESSES=0 does the same.
+# Several background jobs may want a PDF at once, so a job first takes one of
+# PDF_PROCESSES slots and only then submits: PDF_TIMEOUT measures the render,
+# not time spent queued behind other renders. A slot is freed when its render
+# finishes, so a timed-out render still holds it until the process is free.
+PDF_PROCESSES = int(env("PDF_PROCESSES", "2")) if __name__ != "__main__" else 0
+PDF_TIMEOUT   = 60
+_PDF_POOL      = None
+_PDF_POOL_LOCK = threading.Lock()
+_PDF_SLOTS     = threading.BoundedSemaphore(max(PDF_PROCESSES, 1))
+
+def _get_pdf_pool():
+    global _PDF_POOL
+    if _PDF_POOL is None:
+        with _PDF_POOL_LOCK:
+            if _PDF_POOL is None:
+                methods = multiprocessing.get_all_start_methods()
+                if "forkserver" in methods:
+                    ctx = multiprocessing.get_context("forkserver")
+                    ctx.set_forkserver_preload(["pdfs"])   # ReportLab loaded once, in the server
+                else:
+                    ctx = multiprocessing.get_context("spawn")
+                _PDF_POOL = ProcessPoolExecutor(max_workers=PDF_PROCESSES, mp_context=ctx)
+    return _PDF_POOL
+
+def _drop_pdf_pool(pool):
+    """Shut down a broken pool (once, whichever thread sees it first); the next render builds a new one"""
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is not pool:
+            return
+        _PDF_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _free_pdf_slot(_fut):
+    _PDF_SLOTS.release()
+
+def render_pdf(builder, d):
+    """Build a PDF off the GIL when the pool is enabled; falls back to in-thread"""
+    if PDF_PROCESSES > 0 and _PDF_SLOTS.acquire(timeout=PDF_TIMEOUT):
+        pool = _get_pdf_pool()
+        try:
+            fut = pool.submit(_render_pdf, builder, d)
+        except BrokenProcessPool as e:
+            _PDF_SLOTS.release()
+            log.error("PDF pool broken, rebuilding: %s", e)
+            _drop_pdf_pool(pool)
+        else:
+            fut.add_done_callback(_free_pdf_slot)
+            try:
+                return io.BytesIO(fut.result(timeout=PDF_TIMEOUT))
+            except BrokenProcessPool as e:
+                log.error("PDF pool broken, rebuilding: %s", e)
+                _drop_pdf_pool(pool)
+            except FuturesTimeout:
+                fut.cancel()
+                log.error("PDF render timed out in pool [%s], building in-thread", builder)
+    return PDF_BUILDERS[builder](d)
 
 def _clean_phone(phone):
     return phone.replace("whatsapp:+","").replace("+","").replace(" ","")
 
-def select_and_generate_pdf(invoice_data, seller_phone):
+# invoice_type keyword → (builder, storage folder); anything else is a plain invoice.
+# Keywords are checked in this order, not by position: "TAX CREDIT NOTE" is a
+# credit note and "TAX INVOICE / BILL OF SUPPLY" a bill of supply.
+_INV_TYPE_KEYS = ("CREDIT", "BILL", "TAX")
+_PDF_DISPATCH  = {
+    "CREDIT": ("credit_note",    "credit_notes"),
+    "BILL":   ("bill_of_supply", "invoices"),
+    "TAX":    ("tax_invoice",    "invoices"),
+    "":       ("nongst_invoice", "invoices"),
+}
+
+def _pdf_target(invoice_data, seller_phone):
+    """(builder name, storage path) for an invoice — the path fixes its public URL up front"""
     itype  = (invoice_data.get("invoice_type") or "").upper()
     inv_no = invoice_data.get("invoice_number") or f"GUT-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    if   "CREDIT" in itype: pdf_bytes, sub = build_credit_note(invoice_data),    "credit_notes"
-    elif "BILL"   in itype: pdf_bytes, sub = build_bill_of_supply(invoice_data), "invoices"
-    elif "TAX"    in itype: pdf_bytes, sub = build_tax_invoice(invoice_data),    "invoices"
-    else:                   pdf_bytes, sub = build_nongst_invoice(invoice_data), "invoices"
-    phone = _clean_phone(seller_phone)
-    return upload_pdf_to_supabase(pdf_bytes, f"{phone}/{sub}/{inv_no}.pdf")
+    builder, sub = _PDF_DISPATCH[next((k for k in _INV_TYPE_KEYS if k in itype), "")]
+    return builder, f"{_clean_phone(seller_phone)}/{sub}/{inv_no}.pdf"
+
+def select_and_generate_pdf(invoice_data, seller_phone):
+    builder, path = _pdf_target(invoice_data, seller_phone)
+    return upload_pdf_to_supabase(render_pdf(builder, invoice_data), path)
+
+def generate_upload_and_save(invoice_data, seller_phone):
+    """
+    Render, then upload the PDF and insert the invoice row concurrently — the
+    row only needs the public URL, which is known before the upload finishes.
+    If the upload fails the row is removed again, so numbering is unaffected.
+    """
+    builder, path = _pdf_target(invoice_data, seller_phone)
+    pdf      = render_pdf(builder, invoice_data)
+    save_fut = IO_POOL.submit(save_invoice, seller_phone, invoice_data, pdf_public_url(path))
+    try:
+        url = upload_pdf_to_supabase(pdf, path)
+    except Exception:
+        if save_fut.result():
+            delete_invoice(seller_phone, invoice_data.get("invoice_number", ""))
+        raise
+    save_fut.result()
+    return url
 
 def generate_report_pdf_and_upload(report_data, seller_phone):
     month = report_data.get("report_month","Report")
     year  = report_data.get("report_year", datetime.now().year)
     phone = _clean_phone(seller_phone)
-    return upload_pdf_to_supabase(build_monthly_report(report_data),
+    return upload_pdf_to_supabase(render_pdf("monthly_report", report_data),
                                   f"{phone}/reports/{month}_{year}.pdf")
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # SUPABASE HELPERS — ALL wrapped in try/except, never crash the webhook
 # ═══════════════════════════════════════════════════════════════════════════════
 
+# Built once — requests copies headers per call, and callers that need a
+# variant spread it ({**sb_h(), ...}) rather than mutating it
+SB_HEADERS = {"apikey": SUPABASE_KEY,
+              "Authorization": f"Bearer {SUPABASE_KEY}",
+              "Content-Type": "application/json",
+              "Prefer": "return=representation"}
+SB_REST    = f"{SUPABASE_URL}/rest/v1/"
+
 def sb_h():
-    return {"apikey": env("SUPABASE_KEY"),
-            "Authorization": f"Bearer {env('SUPABASE_KEY')}",
-            "Content-Type": "application/json",
-            "Prefer": "return=representation"}
+    return SB_HEADERS   # Content-Type is set here — request bodies are pre-encoded with orjson
 
 def sb_url(table, q=""):
-    return f"{env('SUPABASE_URL')}/rest/v1/{table}{q}"
-
-def get_seller(phone):
+    return f"{SB_REST}{table}{q}"
+
+# Sellers message in bursts — keep recent profiles for a minute instead of
+# re-reading Supabase on every webhook. Writes below evict the entry, but only
+# in this worker: another gunicorn worker keeps its copy until the TTL runs
+# out. So only finished profiles are cached (onboarding is a state machine
+# driven by onboarding_step), and text messages read fresh (fresh=True).
+SELLER_CACHE = TTLCache(maxsize=5000, ttl=60)
+SELLER_CACHE_STATS = {"hits": 0, "misses": 0}   # shown on /debug
+# Per-phone write generation: a read only caches its row if no write to that
+# seller finished while it was in flight, so a GET racing a PATCH can't put
+# the old row back.
+_SELLER_GEN  = TTLCache(maxsize=5000, ttl=300)
+_SELLER_LOCK = threading.Lock()
+
+def _forget_seller(phone):
+    with _SELLER_LOCK:
+        SELLER_CACHE.pop(phone, None)
+        _SELLER_GEN[phone] = _SELLER_GEN.get(phone, 0) + 1
+
+def get_seller(phone, fresh=False):
+    with _SELLER_LOCK:
+        cached = None if fresh else SELLER_CACHE.get(phone)
+        gen    = _SELLER_GEN.get(phone, 0)
+        if not fresh:
+            SELLER_CACHE_STATS["hits" if cached is not None else "misses"] += 1
+    if cached is not None:
+        return cached
     try:
         ph = url_quote(phone, safe='')
-        r = requests.get(sb_url("sellers", f"?phone_number=eq.{ph}&limit=1"),
-                         headers=sb_h(), timeout=10)
+        r = SESSION.get(sb_url("sellers", f"?phone_number=eq.{ph}&limit=1"),
+                        headers=sb_h(), timeout=10)
         d = safe_json(r, "get_seller")
-        return d[0] if isinstance(d, list) and d else None
+        seller = d[0] if isinstance(d, list) and d else None
+        if seller and seller.get("onboarding_step") == "complete":
+            with _SELLER_LOCK:
+                if _SELLER_GEN.get(phone, 0) == gen:
+                    SELLER_CACHE[phone] = seller
+        return seller
     except Exception as e:
-        log.error(f"get_seller failed: {e}")
+        log.error("get_seller failed: %s", e)
         return None
 
 def create_seller(phone):
+    _forget_seller(phone)
     try:
-        r = requests.post(sb_url("sellers"), headers=sb_h(),
-                          json={"phone_number": phone, "onboarding_step": "language_asked",
-                                "language": "english", "created_at": datetime.utcnow().isoformat()},
-                          timeout=10)
+        r = SESSION.post(sb_url("sellers"), headers=sb_h(),
+                         data=orjson.dumps({"phone_number": phone, "onboarding_step": "language_asked",
+                                            "language": "english", "created_at": datetime.utcnow().isoformat()}),
+                         timeout=10)
         d = safe_json(r, "create_seller")
         if isinstance(d, list) and d:
             return d[0]
         return {"phone_number": phone, "onboarding_step": "language_asked", "language": "english"}
     except Exception as e:
-        log.error(f"create_seller failed: {e}")
+        log.error("create_seller failed: %s", e)
         return {"phone_number": phone, "onboarding_step": "language_asked", "language": "english"}
 
 def update_seller(phone, updates):
     try:
         ph = url_quote(phone, safe='')
-        r = requests.patch(sb_url("sellers", f"?phone_number=eq.{ph}"),
-                           headers=sb_h(), json=updates, timeout=10)
-        log.info(f"update_seller {updates} → {r.status_code}")
+        r = SESSION.patch(sb_url("sellers", f"?phone_number=eq.{ph}"),
+                          headers=sb_h(), data=orjson.dumps(updates), timeout=10)
+        log.info("update_seller %s → %s", updates, r.status_code)
         return safe_json(r, "update_seller")
     except Exception as e:
-        log.error(f"update_seller failed: {e}")
+        log.error("update_seller failed: %s", e)
         return None
+    finally:
+        # Evict and bump the generation once the write has landed — a read
+        # that was already in flight then won't cache the row it fetched
+        _forget_seller(phone)
+
+# Older deployments haven't run the ALTER TABLEs in the module docstring. Once
+# PostgREST reports an unknown column, skip the doomed full insert for a while;
+# after EXTRA_COLS_RECHECK seconds the extended columns are tried again, so a
+# migration is picked up without restarting the workers.
+EXTRA_COLS_RECHECK    = 600
+_EXTRA_COLS_RETRY_AT  = 0.0   # time.monotonic() before which core-only is used
+_MISSING_COLUMN_CODES = ("PGRST204", "42703")
+
+def _extra_cols_enabled():
+    return time.monotonic() >= _EXTRA_COLS_RETRY_AT
+
+def _extra_cols_missing():
+    global _EXTRA_COLS_RETRY_AT
+    _EXTRA_COLS_RETRY_AT = time.monotonic() + EXTRA_COLS_RECHECK
 
 def save_invoice(phone, inv_data, pdf_url):
     d = inv_data
+    now = datetime.utcnow()   # one clock read for month/year defaults + created_at
     # Parse invoice month/year from the invoice's own date field if available
     _inv_date_str = d.get("invoice_date", "")
-    _inv_month = datetime.utcnow().month
-    _inv_year  = datetime.utcnow().year
+    _inv_month = now.month
+    _inv_year  = now.year
     if _inv_date_str:
         try:
             # Format: DD/MM/YYYY
@@ -965,9 +597,9 @@ def save_invoice(phone, inv_data, pdf_url):
         "invoice_number": d.get("invoice_number", ""),
         "customer_name": d.get("customer_name", ""),
         "total_amount":  d.get("total_amount", 0),
-        "invoice_data":  json.dumps(d),
+        "invoice_data":  orjson.dumps(d).decode(),
         "pdf_url":       pdf_url,
-        "created_at":    datetime.utcnow().isoformat(),
+        "created_at":    now.isoformat(),
         "invoice_month": _inv_month,
         "invoice_year":  _inv_year,
     }
@@ -980,74 +612,123 @@ def save_invoice(phone, inv_data, pdf_url):
         "is_cancelled": False,
         "credit_note_for": d.get("original_invoice_number", ""),
     }
+    h = {**sb_h(), "Prefer": "return=minimal"}   # nobody reads the inserted row back
     try:
-        r = requests.post(sb_url("invoices"), headers=sb_h(),
-                          json={**core, **extra}, timeout=10)
-        if r.status_code in (200, 201):
-            log.info(f"save_invoice OK: {d.get('invoice_number')}")
-            return safe_json(r, "save_invoice")
-        log.warning(f"save_invoice full failed {r.status_code}, trying core only")
-        r2 = requests.post(sb_url("invoices"), headers=sb_h(), json=core, timeout=10)
-        log.info(f"save_invoice core: {r2.status_code}")
-        return safe_json(r2, "save_invoice_core")
+        if _extra_cols_enabled():
+            r = SESSION.post(sb_url("invoices"), headers=h, data=orjson.dumps({**core, **extra}), timeout=10)
+            if r.status_code in (200, 201, 204):
+                log.info("save_invoice OK: %s", d.get("invoice_number"))
+                return True
+            log.warning("save_invoice full failed %s, trying core only", r.status_code)
+            if any(code in r.text for code in _MISSING_COLUMN_CODES):
+                log.warning("invoices table lacks the extended columns — core-only inserts for %ds",
+                            EXTRA_COLS_RECHECK)
+                _extra_cols_missing()
+        r2 = SESSION.post(sb_url("invoices"), headers=h, data=orjson.dumps(core), timeout=10)
+        log.info("save_invoice core: %s", r2.status_code)
+        return True if r2.status_code in (200, 201, 204) else None
     except Exception as e:
-        log.error(f"save_invoice failed: {e}")
+        log.error("save_invoice failed: %s", e)
         return None
 
 def cancel_invoice_in_db(phone, invoice_number):
     try:
         ph  = url_quote(phone, safe='')
         inv = url_quote(invoice_number, safe='')
-        r = requests.patch(
+        r = SESSION.patch(
             sb_url("invoices", f"?seller_phone=eq.{ph}&invoice_number=eq.{inv}"),
-            headers=sb_h(), json={"is_cancelled": True}, timeout=10)
+            headers=sb_h(), data=b'{"is_cancelled":true}', timeout=10)
         return safe_json(r, "cancel_invoice")
     except Exception as e:
-        log.error(f"cancel_invoice failed: {e}")
+        log.error("cancel_invoice failed: %s", e)
         return None
 
-def get_invoice_by_number(phone, invoice_number):
+def delete_invoice(phone, invoice_number):
+    if not invoice_number:
+        return None   # never issue an unscoped delete
     try:
         ph  = url_quote(phone, safe='')
         inv = url_quote(invoice_number, safe='')
-        r = requests.get(
-            sb_url("invoices", f"?seller_phone=eq.{ph}&invoice_number=eq.{inv}&limit=1"),
+        r = SESSION.delete(
+            sb_url("invoices", f"?seller_phone=eq.{ph}&invoice_number=eq.{inv}"),
             headers=sb_h(), timeout=10)
-        d = safe_json(r, "get_invoice")
-        return d[0] if isinstance(d, list) and d else None
+        log.info("delete_invoice %s → %s", invoice_number, r.status_code)
+        return r.status_code in (200, 204)
     except Exception as e:
-        log.error(f"get_invoice failed: {e}")
+        log.error("delete_invoice failed: %s", e)
         return None
 
+def get_invoices_by_numbers(phone, numbers):
+    """{invoice_number: row} for whichever of `numbers` exist — one round-trip"""
+    try:
+        ph   = url_quote(phone, safe='')
+        nums = ",".join(f'"{n}"' for n in numbers)
+        r = SESSION.get(
+            sb_url("invoices", f"?seller_phone=eq.{ph}&invoice_number=in.({url_quote(nums, safe=',')})"
+                               f"&limit={len(numbers)}"),
+            headers=sb_h(), timeout=10)
+        d = safe_json(r, "get_invoices")
+        return {row.get("invoice_number"): row for row in d} if isinstance(d, list) else {}
+    except Exception as e:
+        log.error("get_invoices failed: %s", e)
+        return {}
+
+# Only the columns _parse_row reads — skips pdf_url, rates, timestamps etc.
+# The extended ones are dropped on deployments whose table lacks them.
+_REPORT_COLS       = "invoice_number,customer_name,invoice_type,total_amount,invoice_data"
+_REPORT_EXTRA_COLS = ",invoice_date,taxable_value,cgst,sgst,igst,is_cancelled"
+
 def get_all_monthly_invoices(phone, month, year):
     try:
         ph = url_quote(phone, safe='')
-        r = requests.get(
-            sb_url("invoices", f"?seller_phone=eq.{ph}&invoice_month=eq.{month}&invoice_year=eq.{year}"),
-            headers=sb_h(), timeout=15)
+        q  = f"?seller_phone=eq.{ph}&invoice_month=eq.{month}&invoice_year=eq.{year}&order=created_at.asc"
+        extra = _extra_cols_enabled()
+        cols  = _REPORT_COLS + (_REPORT_EXTRA_COLS if extra else "")
+        r = SESSION.get(sb_url("invoices", f"{q}&select={cols}"), headers=sb_h(), timeout=15)
+        if (extra and r.status_code == 400
+                and any(code in r.text for code in _MISSING_COLUMN_CODES)):
+            log.warning("invoices table lacks the extended columns — core-only reads for %ds",
+                        EXTRA_COLS_RECHECK)
+            _extra_cols_missing()
+            r = SESSION.get(sb_url("invoices", f"{q}&select={_REPORT_COLS}"), headers=sb_h(), timeout=15)
         d = safe_json(r, "monthly_invoices")
         return d if isinstance(d, list) else []
     except Exception as e:
-        log.error(f"monthly_invoices failed: {e}")
+        log.error("monthly_invoices failed: %s", e)
         return []
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # SEQUENTIAL INVOICE NUMBERING
 # ═══════════════════════════════════════════════════════════════════════════════
 
+@lru_cache(maxsize=1)
+def _month_year(epoch_minute):
+    dt = datetime.utcfromtimestamp(epoch_minute * 60)
+    return dt.month, dt.year
+
+def current_month_year():
+    """(month, year) in UTC for numbering — recomputed at most once a minute"""
+    return _month_year(int(time.time()) // 60)
+
+_CLEAN_BIZ_RE = re.compile(r"[^A-Z0-9]")
+
 def get_invoice_prefix(seller):
     biz     = (seller.get("business_name") or seller.get("seller_name") or "GUT").upper()
-    cleaned = re.sub(r"[^A-Z0-9]", "", biz)
+    cleaned = _CLEAN_BIZ_RE.sub("", biz)
     return (cleaned + "GUT")[:3]
 
 def get_next_seq(phone, month, year, is_credit=False):
     type_q = "eq.CREDIT NOTE" if is_credit else "neq.CREDIT NOTE"
     ph = url_quote(phone, safe='')
-    q  = f"?seller_phone=eq.{ph}&invoice_month=eq.{month}&invoice_year=eq.{year}&invoice_type={type_q}&select=id"
+    q  = f"?seller_phone=eq.{ph}&invoice_month=eq.{month}&invoice_year=eq.{year}&invoice_type={type_q}"
     try:
-        r = requests.get(sb_url("invoices", q), headers=sb_h(), timeout=10)
-        d = safe_json(r, "seq")
-        return (len(d) if isinstance(d, list) else 0) + 1
+        # Let PostgREST count server-side: HEAD + count=exact returns the
+        # total in Content-Range ("*/42") instead of shipping every id.
+        r = SESSION.head(sb_url("invoices", q),
+                         headers={**sb_h(), "Prefer": "count=exact", "Range": "0-0"},
+                         timeout=10)
+        total = r.headers.get("Content-Range", "").rpartition("/")[2]
+        return (int(total) if total.isdigit() else 0) + 1
     except Exception:
         return 1
 
@@ -1062,12 +743,24 @@ def generate_credit_note_number(phone, seller, month, year):
 # INVOICE PIPELINE
 # ═══════════════════════════════════════════════════════════════════════════════
 
+MAX_AUDIO_BYTES = 16 * 1024 * 1024   # WhatsApp's own media limit
+AUDIO_CHUNK     = 64 * 1024
+
 def download_audio(media_url):
-    r = requests.get(media_url, auth=(env("TWILIO_ACCOUNT_SID"), env("TWILIO_AUTH_TOKEN")), timeout=30)
-    if r.status_code != 200:
-        raise Exception(f"Audio download failed {r.status_code}")
-    log.info(f"Audio downloaded: {len(r.content)} bytes | Content-Type: {r.headers.get('Content-Type','unknown')}")
-    return r.content
+    """Stream the voice note in chunks — rejects oversized media before buffering it."""
+    with SESSION.get(media_url, auth=(TWILIO_SID, TWILIO_TOKEN), timeout=30, stream=True) as r:
+        if r.status_code != 200:
+            raise Exception(f"Audio download failed {r.status_code}")
+        if int(r.headers.get("Content-Length") or 0) > MAX_AUDIO_BYTES:
+            raise Exception(f"Audio too large: {r.headers.get('Content-Length')} bytes")
+        buf = bytearray()
+        for chunk in r.iter_content(AUDIO_CHUNK):
+            buf += chunk
+            if len(buf) > MAX_AUDIO_BYTES:
+                raise Exception(f"Audio too large: >{MAX_AUDIO_BYTES} bytes")
+        ctype = r.headers.get("Content-Type", "unknown")
+    log.info("Audio downloaded: %s bytes | Content-Type: %s", len(buf), ctype)
+    return bytes(buf)
 
 def _call_sarvam(audio_bytes, lang_code, model="saaras:v2.5"):
     """
@@ -1081,95 +774,139 @@ def _call_sarvam(audio_bytes, lang_code, model="saaras:v2.5"):
         ("audio/mpeg",            "audio.mp3"),
     ]:
         try:
-            r = requests.post(
+            r = SESSION.post(
                 "https://api.sarvam.ai/speech-to-text",
                 files={"file": (fname, audio_bytes, mime)},
                 data={"model": model,
                       "language_code": lang_code,
                       "with_disfluencies": "false"},
-                headers={"api-subscription-key": env("SARVAM_API_KEY")},
+                headers={"api-subscription-key": SARVAM_API_KEY},
                 timeout=60
             )
-            log.info(f"Sarvam [{model}|{lang_code}|{mime}] → HTTP {r.status_code} | {r.text[:200]}")
+            log.info("Sarvam [%s|%s|%s] → HTTP %s | %s", model, lang_code, mime, r.status_code, r.text[:200])
             if r.status_code == 200:
                 result = safe_json(r, f"Sarvam-{lang_code}")
                 tr = (result or {}).get("transcript", "").strip()
                 if tr:
                     return tr
         except Exception as e:
-            log.error(f"Sarvam call error [{model}|{lang_code}|{mime}]: {e}")
+            log.error("Sarvam call error [%s|%s|%s]: %s", model, lang_code, mime, e)
     return ""
 
+# Resent / forwarded voice notes are byte-identical — reuse their transcript
+TRANSCRIPT_CACHE = TTLCache(maxsize=2000, ttl=86400)
+_TRANSCRIPT_LOCK = threading.Lock()
+
+# Twilio redelivers a webhook under a fresh request when the first one is slow;
+# the media URL is stable, so a retry skips the download and Sarvam entirely
+MEDIA_TRANSCRIPT_CACHE = TTLCache(maxsize=2048, ttl=3600)
+
+def transcribe_media(media_url, language="telugu"):
+    """Download + transcribe, reusing the transcript already produced for this media URL"""
+    key = (media_url, language)
+    with _TRANSCRIPT_LOCK:
+        cached = MEDIA_TRANSCRIPT_CACHE.get(key)
+    if cached:
+        log.info("✅ Media transcript cache hit: %s", cached)
+        return cached
+    tr = transcribe_audio(download_audio(media_url), language)
+    if tr:
+        with _TRANSCRIPT_LOCK:
+            MEDIA_TRANSCRIPT_CACHE[key] = tr
+    return tr
+
 def transcribe_audio(audio_bytes, language="telugu"):
+    """Transcribe, reusing the cached transcript for identical audio (keyed by SHA-256)"""
+    key = (hashlib.sha256(audio_bytes).hexdigest(), language)
+    with _TRANSCRIPT_LOCK:
+        cached = TRANSCRIPT_CACHE.get(key)
+    if cached:
+        log.info("✅ Transcript cache hit [%s]: %s", key[0][:12], cached)
+        return cached
+    tr = _transcribe_uncached(audio_bytes, language)
+    if tr:
+        with _TRANSCRIPT_LOCK:
+            TRANSCRIPT_CACHE[key] = tr
+    return tr
+
+def _transcribe_uncached(audio_bytes, language="telugu"):
     """
     Transcribe WhatsApp voice note.
     Strategy:
       1. Try saaras:v2.5 with user's preferred language (te-IN or en-IN)
-      2. If empty, try saaras:v2.5 with the other language
+      2. If empty, let saaras:v2.5 auto-detect the language ("unknown") —
+         one pass covers English, Telugu or mixed speech, instead of
+         guessing the other language and paying for a second full retry
       3. If still empty, try saaras:v3 as upgrade fallback
     """
-    primary   = "te-IN" if language == "telugu" else "en-IN"
-    secondary = "en-IN" if language == "telugu" else "te-IN"
+    primary = "te-IN" if language == "telugu" else "en-IN"
 
     # Try primary language with v2.5 (proven working model)
     tr = _call_sarvam(audio_bytes, primary, "saaras:v2.5")
     if tr:
-        log.info(f"✅ Transcribed [v2.5|{primary}]: {tr}")
+        log.info("✅ Transcribed [v2.5|%s]: %s", primary, tr)
         return tr
 
-    # Fallback to secondary language with v2.5
-    log.warning(f"v2.5 [{primary}] empty, trying [{secondary}]")
-    tr = _call_sarvam(audio_bytes, secondary, "saaras:v2.5")
+    # Stored language may be wrong for this speaker — auto-detect in one pass
+    log.warning("v2.5 [%s] empty, retrying with language auto-detect", primary)
+    tr = _call_sarvam(audio_bytes, "unknown", "saaras:v2.5")
     if tr:
-        log.info(f"✅ Transcribed [v2.5|{secondary}] fallback: {tr}")
+        log.info("✅ Transcribed [v2.5|auto-detect] fallback: %s", tr)
         return tr
 
     # Last resort: try saaras:v3
-    log.warning("v2.5 both languages empty, trying saaras:v3")
+    log.warning("v2.5 primary + auto-detect empty, trying saaras:v3")
     tr = _call_sarvam(audio_bytes, primary, "saaras:v3")
     if tr:
-        log.info(f"✅ Transcribed [v3|{primary}]: {tr}")
+        log.info("✅ Transcribed [v3|%s]: %s", primary, tr)
         return tr
 
     log.error("❌ All Sarvam transcription attempts failed")
     return ""
 
+# Byte-identical on every call (nothing interpolated) and marked as a cache
+# breakpoint, so Claude can serve it from the prompt cache once the prefix
+# reaches the model's minimum cacheable length — only the transcript-bearing
+# user turn changes per invoice.
+INVOICE_SYSTEM_PROMPT = (
+    "You are a GST invoice data extractor for Indian businesses. "
+    "The input may be Telugu, English, or a mix of both — handle all cases. "
+    "Return ONLY valid JSON, no explanation, no markdown.\n\n"
+    "INVOICE TYPE RULES:\n"
+    "  - TAX INVOICE: GST mentioned, percentage (18%/12%/5%/28%), customer has GSTIN\n"
+    "  - BILL OF SUPPLY: composition dealer, exempt goods, no GST charged\n"
+    "  - INVOICE: no GST at all, no GSTIN, simple sale\n\n"
+    "CALCULATION RULES:\n"
+    "  - Intra-state: cgst_rate = sgst_rate = gst_rate/2, igst = 0\n"
+    "  - Inter-state: igst_rate = full gst_rate, cgst = sgst = 0\n"
+    "  - amount per item = qty * rate\n"
+    "  - taxable_value = sum of all amounts\n"
+    "  - cgst = taxable_value * cgst_rate/100\n"
+    "  - sgst = taxable_value * sgst_rate/100\n"
+    "  - total_amount = taxable_value + cgst + sgst + igst\n\n"
+    "TELUGU KEYWORDS: customer/కస్టమర్=customer_name, పీస్/కిలో/లీటర్=unit, "
+    "రేటు/ధర=rate, జిఎస్టి/శాతం=gst_rate, మొత్తం=total"
+)
+INVOICE_SYSTEM = [{"type": "text", "text": INVOICE_SYSTEM_PROMPT,
+                   "cache_control": {"type": "ephemeral"}}]
+
 def extract_invoice_data(transcript, seller, phone, month, year):
     sname  = seller.get("business_name") or seller.get("seller_name") or ""
     saddr  = seller.get("address") or seller.get("seller_address") or ""
     sgstin = seller.get("gstin") or seller.get("seller_gstin") or ""
-    inv_no = generate_invoice_number(phone, seller, month, year)
+    # Numbering is a Supabase count — let it run while Claude extracts
+    inv_no_fut = IO_POOL.submit(generate_invoice_number, phone, seller, month, year)
     today  = datetime.now().strftime("%d/%m/%Y")
 
-    system = (
-        "You are a GST invoice data extractor for Indian businesses. "
-        "The input may be Telugu, English, or a mix of both — handle all cases. "
-        "Return ONLY valid JSON, no explanation, no markdown.\n\n"
-        "INVOICE TYPE RULES:\n"
-        "  - TAX INVOICE: GST mentioned, percentage (18%/12%/5%/28%), customer has GSTIN\n"
-        "  - BILL OF SUPPLY: composition dealer, exempt goods, no GST charged\n"
-        "  - INVOICE: no GST at all, no GSTIN, simple sale\n\n"
-        "CALCULATION RULES:\n"
-        "  - Intra-state: cgst_rate = sgst_rate = gst_rate/2, igst = 0\n"
-        "  - Inter-state: igst_rate = full gst_rate, cgst = sgst = 0\n"
-        "  - amount per item = qty * rate\n"
-        "  - taxable_value = sum of all amounts\n"
-        "  - cgst = taxable_value * cgst_rate/100\n"
-        "  - sgst = taxable_value * sgst_rate/100\n"
-        "  - total_amount = taxable_value + cgst + sgst + igst\n\n"
-        "TELUGU KEYWORDS: customer/కస్టమర్=customer_name, పీస్/కిలో/లీటర్=unit, "
-        "రేటు/ధర=rate, జిఎస్టి/శాతం=gst_rate, మొత్తం=total"
-    )
     prompt = (
         f'Voice transcription (Telugu/English/mixed): "{transcript}"\n\n'
         f'Seller details (do NOT change):\n'
         f'  seller_name: {sname}\n'
         f'  seller_address: {saddr}\n'
         f'  seller_gstin: {sgstin}\n'
-        f'  invoice_number: {inv_no}\n'
         f'  invoice_date: {today}\n\n'
         f'Return ONLY this JSON with all fields filled from the transcription:\n'
-        f'{{{{"invoice_type":"TAX INVOICE","invoice_number":"{inv_no}","invoice_date":"{today}",'
+        f'{{{{"invoice_type":"TAX INVOICE","invoice_date":"{today}",'
         f'"seller_name":"{sname}","seller_address":"{saddr}","seller_gstin":"{sgstin}",'
         f'"reverse_charge":"No","customer_name":"","customer_address":"","customer_gstin":"",'
         f'"place_of_supply":"","is_interstate":false,'
@@ -1181,7 +918,7 @@ def extract_invoice_data(transcript, seller, phone, month, year):
     )
     msg = get_claude().messages.create(
         model="claude-haiku-4-5-20251001", max_tokens=1500,
-        system=system, messages=[{"role": "user", "content": prompt}]
+        system=INVOICE_SYSTEM, messages=[{"role": "user", "content": prompt}]
     )
     text = msg.content[0].text.strip()
     if "```json" in text: text = text.split("```json")[1].split("```")[0].strip()
@@ -1189,22 +926,29 @@ def extract_invoice_data(transcript, seller, phone, month, year):
     s = text.find("{"); e = text.rfind("}") + 1
     if s == -1 or e == 0:
         raise Exception(f"No JSON from Claude: {text[:200]}")
-    data = json.loads(text[s:e])
+    data = orjson.loads(text[s:e])
+    data["invoice_number"] = inv_no_fut.result()
     itype2 = data.get("invoice_type",""); ino2 = data.get("invoice_number",""); cname2 = data.get("customer_name","")
-    log.info(f"Invoice: {itype2} #{ino2} | Customer: {cname2} | Total: {data.get('total_amount',0)}")
+    log.info("Invoice: %s #%s | Customer: %s | Total: %s", itype2, ino2, cname2, data.get("total_amount",0))
     return data
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # CANCEL / CREDIT NOTE
 # ═══════════════════════════════════════════════════════════════════════════════
 
+CANCEL_KEYWORDS = ["cancel","void","రద్దు","wrong invoice","delete invoice","reverse invoice"]
+CANCEL_RE = re.compile("|".join(map(re.escape, CANCEL_KEYWORDS)), re.IGNORECASE)
+
 def is_cancel_request(text):
-    return any(k in text.lower() for k in ["cancel","void","రద్దు","wrong invoice","delete invoice","reverse invoice"])
+    return CANCEL_RE.search(text) is not None
+
+INVOICE_REF_RE = re.compile(r"([A-Z]{2,6}\d{3}-\d{6})")   # TEJ001-022026
+SHORT_REF_RE   = re.compile(r"(\d{3}-\d{6})")              # 001-022026 (prefix omitted)
 
 def parse_invoice_ref(text):
-    m = re.search(r"([A-Z]{2,6}\d{3}-\d{6})", text.upper())
+    m = INVOICE_REF_RE.search(text.upper())
     if m: return m.group(1)
-    m = re.search(r"(\d{3}-\d{6})", text)
+    m = SHORT_REF_RE.search(text)
     if m: return m.group(1)
     return None
 
@@ -1214,9 +958,10 @@ def handle_cancel_request(from_num, text, seller, lang):
         send_rest(from_num, "⚠️ Please specify the invoice number.\nExample: *cancel TEJ001-022026*"
                   if lang=="english" else "⚠️ Invoice number చెప్పండి.\nExample: *cancel TEJ001-022026*")
         return
-    orig = get_invoice_by_number(from_num, ref)
-    if not orig:
-        orig = get_invoice_by_number(from_num, f"{get_invoice_prefix(seller)}{ref}")
+    # The seller may omit their prefix ("cancel 001-022026") — look up both forms at once
+    full  = f"{get_invoice_prefix(seller)}{ref}"
+    found = get_invoices_by_numbers(from_num, [ref, full])
+    orig  = found.get(ref) or found.get(full)
     if not orig:
         send_rest(from_num, f"⚠️ Invoice *{ref}* not found." if lang=="english"
                   else f"⚠️ Invoice *{ref}* మీ records లో కనుగొనబడలేదు.")
@@ -1228,11 +973,14 @@ def handle_cancel_request(from_num, text, seller, lang):
     if orig.get("invoice_type") == "CREDIT NOTE":
         send_rest(from_num, "⚠️ Credit notes cannot be cancelled.")
         return
-    cancel_invoice_in_db(from_num, orig["invoice_number"])
-    try:    orig_data = json.loads(orig.get("invoice_data","{}"))
-    except: orig_data = orig
     now   = datetime.utcnow()
-    cn_no = generate_credit_note_number(from_num, seller, now.month, now.year)
+    # Independent round-trips: flag the original + count this month's credit notes
+    cancel_fut = IO_POOL.submit(cancel_invoice_in_db, from_num, orig["invoice_number"])
+    cn_fut     = IO_POOL.submit(generate_credit_note_number, from_num, seller, now.month, now.year)
+    try:    orig_data = orjson.loads(orig.get("invoice_data","{}"))
+    except: orig_data = orig
+    cn_no = cn_fut.result()
+    cancel_fut.result()
     credit = {
         **orig_data,
         # Override with correct values — seller from profile, not orig_data
@@ -1263,8 +1011,7 @@ def handle_cancel_request(from_num, text, seller, lang):
         "total_amount":  orig_data.get("total_amount", 0),
         "items":         orig_data.get("items", []),
     }
-    pdf_url = select_and_generate_pdf(credit, from_num)
-    save_invoice(from_num, credit, pdf_url)
+    pdf_url = generate_upload_and_save(credit, from_num)
     total = fmt(orig_data.get("total_amount",0))
     body = (f"✅ *Invoice {orig['invoice_number']} Cancelled*\n\n📋 Credit Note: {cn_no}\n💰 Credit Amount: Rs. {total}\n\nCredit Note PDF attached ↓"
             if lang=="english"
@@ -1282,20 +1029,25 @@ MONTH_MAP = {
     "జులై":7,"ఆగస్టు":8,"సెప్టెంబర్":9,"అక్టోబర్":10,"నవంబర్":11,"డిసెంబర్":12
 }
 MNAMES = {v: k.capitalize() for k, v in MONTH_MAP.items() if k.isascii()}
+_MONTH_RE = re.compile("|".join(re.escape(k) for k in MONTH_MAP), re.IGNORECASE)
+
+REPORT_KEYWORDS = ["report","summary","రిపోర్ట్","సమరీ","monthly","నెల","last month","tax summary","invoices summary","గత నెల"]
+REPORT_RE = re.compile("|".join(map(re.escape, REPORT_KEYWORDS)), re.IGNORECASE)
+_YEAR_RE  = re.compile(r"20\d{2}")
 
 def is_report_request(text):
-    return any(k in text.lower() for k in ["report","summary","రిపోర్ట్","సమరీ","monthly","నెల","last month","tax summary","invoices summary","గత నెల"])
+    return REPORT_RE.search(text) is not None
 
 def parse_month_year(text):
-    tl=text.lower(); year=datetime.now().year
-    m=re.search(r"20\d{2}",text)
+    year=datetime.now().year
+    m=_YEAR_RE.search(text)
     if m: year=int(m.group())
-    for name,num in MONTH_MAP.items():
-        if name in tl: return num, year
+    m=_MONTH_RE.search(text)
+    if m: return MONTH_MAP[m.group().lower()], year
     return datetime.now().month, year
 
 def _parse_row(raw):
-    try:    d = json.loads(raw.get("invoice_data","{}"))
+    try:    d = orjson.loads(raw.get("invoice_data","{}"))
     except: d = {}
     return {
         "invoice_number": raw.get("invoice_number",""),
@@ -1313,38 +1065,52 @@ def _parse_row(raw):
 def _build_hsn(inv_list):
     hsn = {}
     for inv in inv_list:
-        d=inv.get("_data",{}); cr=float(d.get("cgst_rate",0)); sr=float(d.get("sgst_rate",0))
-        ir=float(d.get("igst_rate",0)); inter=str(d.get("is_interstate","false")).lower()=="true"
-        for item in d.get("items",[]):
-            key=str(item.get("hsn_sac","")).strip()
-            if not key: continue
+        d=inv.get("_data",{})
+        # Non-GST / bill-of-supply items usually carry no HSN — skip before parsing rates
+        keyed=[(key,item) for item in d.get("items",[]) if (key:=str(item.get("hsn_sac","")).strip())]
+        if not keyed: continue
+        inter=is_interstate(d)
+        if inter: ir=float(d.get("igst_rate",0))
+        else:     cr=float(d.get("cgst_rate",0)); sr=float(d.get("sgst_rate",0))
+        for key, item in keyed:
             amt=float(item.get("amount",0))
-            if key not in hsn: hsn[key]={"hsn":key,"description":item.get("description",""),"taxable":0,"cgst":0,"sgst":0,"igst":0}
-            hsn[key]["taxable"]+=amt
-            if inter: hsn[key]["igst"]+=round(amt*ir/100,2)
-            else: hsn[key]["cgst"]+=round(amt*cr/100,2); hsn[key]["sgst"]+=round(amt*sr/100,2)
+            row=hsn.get(key)
+            if row is None:
+                row=hsn[key]={"hsn":key,"description":item.get("description",""),"taxable":0,"cgst":0,"sgst":0,"igst":0}
+            row["taxable"]+=amt
+            if inter: row["igst"]+=round(amt*ir/100,2)
+            else: row["cgst"]+=round(amt*cr/100,2); row["sgst"]+=round(amt*sr/100,2)
     return list(hsn.values())
 
-def handle_report_request(from_num, text, seller, lang):
+def handle_report_request(from_num, text, seller, lang, prefetched=None):
+    """prefetched: a future for this month's rows, started by the webhook before queueing"""
     month_num, year = parse_month_year(text)
     mname = MNAMES.get(month_num, str(month_num))
-    all_raw = get_all_monthly_invoices(from_num, month_num, year)
+    all_raw = (prefetched.result() if prefetched is not None
+               else get_all_monthly_invoices(from_num, month_num, year))
     if not all_raw:
         send_rest(from_num, f"📊 No invoices found for {mname} {year}." if lang=="english"
                   else f"📊 {mname} {year} కి invoices లేవు.")
         return
-    parsed = [_parse_row(r) for r in all_raw]
-    credit_ns = [p for p in parsed if p["invoice_type"]=="CREDIT NOTE"]
-    regular   = [p for p in parsed if p["invoice_type"]!="CREDIT NOTE"]
-    active    = [p for p in regular if not p.get("_cancelled")]
-    tax_inv    = [i for i in active if "TAX"  in i["invoice_type"].upper()]
-    bos_inv    = [i for i in active if "BILL" in i["invoice_type"].upper()]
-    nongst_inv = [i for i in active if i["invoice_type"].upper() in ("INVOICE","NON-GST","NONGST")]
-    gt = sum(i["taxable_value"] for i in regular)
-    gc = sum(i["cgst"] for i in regular); gs = sum(i["sgst"] for i in regular)
-    gi = sum(i["igst"] for i in regular)
-    rc = sum(i["cgst"] for i in credit_ns); rs = sum(i["sgst"] for i in credit_ns)
-    ri = sum(i["igst"] for i in credit_ns)
+    # One pass: bucket each row and accumulate the gross / reversed tax totals
+    credit_ns, regular, active, tax_inv, bos_inv, nongst_inv = [], [], [], [], [], []
+    gt = gc = gs = gi = rc = rs = ri = 0.0
+    for raw in all_raw:
+        i = _parse_row(raw)
+        t = i["invoice_type"]
+        if t == "CREDIT NOTE":
+            credit_ns.append(i)
+            rc += i["cgst"]; rs += i["sgst"]; ri += i["igst"]
+            continue
+        regular.append(i)
+        gt += i["taxable_value"]; gc += i["cgst"]; gs += i["sgst"]; gi += i["igst"]
+        if i["_cancelled"]:
+            continue
+        active.append(i)
+        t = t.upper()
+        if "TAX" in t: tax_inv.append(i)
+        if "BILL" in t: bos_inv.append(i)
+        if t in ("INVOICE","NON-GST","NONGST"): nongst_inv.append(i)
     net = (gc+gs+gi)-(rc+rs+ri)
     report = {
         "report_month": mname, "report_year": year,
@@ -1395,10 +1161,7 @@ def handle_onboarding(from_num, body, seller):
                 "*SKIP* → నేరుగా invoice చేయండి"
             )
         else:
-            return twiml_reply(
-                "Welcome to *GutInvoice* 🎙️\n_Every Invoice has a Voice_\n\n"
-                "Choose your language:\n1️⃣ English\n2️⃣ Telugu / తెలుగు"
-            )
+            return WELCOME_TWIML
 
     if step == "registration_asked":
         if any(x in tl for x in ["yes", "అవున"]):
@@ -1476,11 +1239,44 @@ def handle_onboarding(from_num, body, seller):
 # VOICE NOTE BACKGROUND PROCESSOR
 # ═══════════════════════════════════════════════════════════════════════════════
 
+# Shared pool for webhook work — reused threads instead of one new thread per message.
+# Jobs mostly wait on Twilio/Sarvam/Claude/Supabase, so it is sized for I/O,
+# not CPUs (cpu_count() reports the host's cores inside a container). Past
+# MAX_PENDING_JOBS queued + running, new work is refused with a "busy" reply
+# instead of piling up unbounded in the executor queue.
+WORKER_THREADS   = int(env("WORKER_THREADS", "32"))
+MAX_PENDING_JOBS = int(env("MAX_PENDING_JOBS", str(WORKER_THREADS * 4)))
+EXECUTOR = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="gutinvoice-bg")
+_pending      = 0
+_PENDING_LOCK = threading.Lock()
+
+def _job_done(fut):
+    global _pending
+    with _PENDING_LOCK:
+        _pending -= 1
+    e = fut.exception()
+    if e:
+        log.error("Background job failed: %s", e, exc_info=e)
+
+def run_background(fn, *args):
+    """
+    Queue fn(*args) on EXECUTOR so the webhook can ACK Twilio right away.
+    Returns None (job not queued) when the backlog is full.
+    """
+    global _pending
+    with _PENDING_LOCK:
+        if _pending >= MAX_PENDING_JOBS:
+            log.warning("⚠️ Background backlog full (%d jobs), refusing %s", _pending, fn.__name__)
+            return None
+        _pending += 1
+    fut = EXECUTOR.submit(fn, *args)
+    fut.add_done_callback(_job_done)
+    return fut
+
 def process_voice_note(from_num, media_url, seller, lang):
     """Background thread: download → transcribe → extract → PDF → send via REST"""
     try:
-        audio = download_audio(media_url)
-        tr    = transcribe_audio(audio, lang)
+        tr = transcribe_media(media_url, lang)
         if not tr.strip():
             send_rest(from_num,
                       "⚠️ Could not understand audio. Please speak clearly and try again."
@@ -1497,10 +1293,8 @@ def process_voice_note(from_num, media_url, seller, lang):
                   "⏳ Generating your invoice... (Ready in ~30 seconds)"
                   if lang == "english"
                   else "⏳ మీ invoice తయారవుతుంది... (~30 seconds)")
-        now = datetime.utcnow()
-        inv = extract_invoice_data(tr, seller, from_num, now.month, now.year)
-        url = select_and_generate_pdf(inv, from_num)
-        save_invoice(from_num, inv, url)
+        inv = extract_invoice_data(tr, seller, from_num, *current_month_year())
+        url = generate_upload_and_save(inv, from_num)
         itype  = inv.get("invoice_type", "Invoice")
         inv_no = inv.get("invoice_number", "")
         cname  = inv.get("customer_name", "")
@@ -1517,9 +1311,9 @@ def process_voice_note(from_num, media_url, seller, lang):
                     f"💰 Total: Rs. {total}\n\n"
                     f"Powered by *GutInvoice* 🎙️")
         send_rest(from_num, msg, url)
-        log.info(f"✅ Invoice done | {inv_no} | {from_num}")
+        log.info("✅ Invoice done | %s | %s", inv_no, from_num)
     except Exception as e:
-        log.error(f"process_voice_note error: {e}", exc_info=True)
+        log.error("process_voice_note error: %s", e, exc_info=True)
         send_rest(from_num,
                   "⚠️ Something went wrong processing your voice note. Please try again."
                   if lang == "english"
@@ -1533,38 +1327,115 @@ def process_voice_note(from_num, media_url, seller, lang):
 GREETINGS = {"hi", "hello", "hey", "hii", "helo", "start",
              "హలో", "నమస్కారం", "namaste", "నమస్తే"}
 
+# Exact-match text commands → action; one lookup per message
+COMMAND_DISPATCH = {
+    **dict.fromkeys(GREETINGS, "greet"),
+    **dict.fromkeys(("help", "హెల్ప్", "status"), "help"),
+    **dict.fromkeys(("update", "register"), "update"),
+}
+
+# Static webhook replies, keyed by (reply, language)
+MSG = {
+    ("voice_ack", "english"):
+        "🎙️ Voice note received! Processing...\n⏳ Your invoice will arrive in ~30 seconds.",
+    ("voice_ack", "telugu"):
+        "🎙️ Voice note అందింది! Process అవుతుంది...\n⏳ Invoice ~30 seconds లో వస్తుంది.",
+    ("update", "english"):
+        "✏️ Let's update your business profile!\n\nEnter your *Business Name*:",
+    ("update", "telugu"):
+        "✏️ మీ business profile update చేద్దాం!\n\nమీ *వ్యాపార పేరు* enter చేయండి:",
+    ("cancel_ack", "english"): "⏳ Processing cancellation request...",
+    ("cancel_ack", "telugu"):  "⏳ Cancellation process అవుతుంది...",
+    ("report_ack", "english"): "📊 Generating your report... (30–60 seconds)",
+    ("report_ack", "telugu"):  "📊 Report తయారవుతుంది... (30-60 seconds)",
+    ("nudge", "english"):
+        "🎙️ Send a *voice note* to create an invoice instantly!\n\n"
+        "Or type:\n• *HI* — Language & menu\n• *HELP* — Your profile\n• *UPDATE* — Edit business details",
+    ("nudge", "telugu"):
+        "🎙️ Invoice కోసం *voice note* పంపండి!\n\n"
+        "లేదా type చేయండి:\n• *HI* — Language & menu\n• *HELP* — Profile\n• *UPDATE* — Business details",
+    ("busy", "english"):  "⏳ We're handling a lot of requests right now. Please resend in a minute.",
+    ("busy", "telugu"):   "⏳ ఇప్పుడు చాలా requests ఉన్నాయి. ఒక నిమిషం తర్వాత మళ్ళీ పంపండి.",
+    ("error", "english"): "⚠️ Something went wrong. Please try again.",
+    ("error", "telugu"):  "⚠️ Error వచ్చింది. మళ్ళీ try చేయండి.",
+}
+
+# The same replies, already wrapped as TwiML responses — the webhook's static
+# branches return one of these without building any XML
+MSG_TWIML = {k: twiml_reply(text) for k, text in MSG.items()}
+NEW_VOICE_TWIML = twiml_reply(
+    "🎙️ Voice note received! Processing your invoice...\n"
+    "⏳ Ready in ~30 seconds.\n\n"
+    "_(Tip: Type *HI* to set your business name & GSTIN)_")
+
+def msg_twiml(key, lang):
+    """Localized static TwiML reply — any non-English language gets Telugu."""
+    return MSG_TWIML[(key, "english" if lang == "english" else "telugu")]
+
+# Twilio re-delivers a webhook it thinks failed (timeout / 5xx). Remember recent
+# MessageSids so a retry can't start a second invoice for the same voice note.
+SEEN_MESSAGES = TTLCache(maxsize=50000, ttl=600)
+_SEEN_LOCK    = threading.Lock()
+
+def first_delivery(sid):
+    """True the first time a MessageSid is seen (in this worker); missing sids always pass"""
+    if not sid:
+        return True
+    with _SEEN_LOCK:
+        if sid in SEEN_MESSAGES:
+            return False
+        SEEN_MESSAGES[sid] = True
+    return True
+
+def reset_to_language_menu(phone):
+    """
+    Greeting: new numbers get a profile, known ones go back to language selection.
+    Runs inline — the reply to the menu is read against this write. A cached
+    profile proves the row exists, so only an uncached number needs the lookup.
+    """
+    with _SELLER_LOCK:
+        known = phone in SELLER_CACHE
+    if known or get_seller(phone, fresh=True):
+        update_seller(phone, {"onboarding_step": "language_asked"})
+    else:
+        create_seller(phone)
+
 @app.route("/webhook", methods=["POST"])
 def webhook():
     from_num  = request.form.get("From", "")
     body      = request.form.get("Body", "") or ""
     media_url = request.form.get("MediaUrl0", "")
     num_media = int(request.form.get("NumMedia", 0))
-    log.info(f"─── Webhook | From:{from_num} | Body:{body[:50]!r} | Media:{num_media}")
+    log.info("─── Webhook | From:%s | Body:%r | Media:%s", from_num, body[:50], num_media)
+    if not first_delivery(request.form.get("MessageSid", "")):
+        log.info("↩️ Duplicate delivery of %s ignored", request.form.get("MessageSid"))
+        return twiml_empty()
 
+    lang = "english"   # bound before any lookup so the error path never re-fetches the seller
     try:
-        seller = get_seller(from_num)
-        tl     = (body or "").strip().lower()
+        tl  = (body or "").strip().lower()
+        cmd = COMMAND_DISPATCH.get(tl)
+
+        # ── STEP 0: "Hi/Hello" text — the reply is the same for new and known
+        # sellers; the create/reset lands before it goes out
+        if cmd == "greet" and not (num_media and media_url):
+            reset_to_language_menu(from_num)
+            return WELCOME_TWIML
+
+        # Voice notes may use a cached (completed) profile; text drives
+        # onboarding and UPDATE, so it always sees the current step
+        seller = get_seller(from_num, fresh=not (num_media and media_url))
 
         # ── STEP 1: Brand new user ─────────────────────────────────────────────
         if not seller:
             seller = create_seller(from_num)
             # If they sent a voice note directly, process it immediately
             if num_media and media_url:
-                t = threading.Thread(
-                    target=process_voice_note,
-                    args=(from_num, media_url, seller or {"language":"telugu"}, "telugu"),
-                    daemon=True
-                )
-                t.start()
-                return twiml_reply(
-                    "🎙️ Voice note received! Processing your invoice...\n"
-                    "⏳ Ready in ~30 seconds.\n\n"
-                    "_(Tip: Type *HI* to set your business name & GSTIN)_"
-                )
-            return twiml_reply(
-                "Welcome to *GutInvoice* 🎙️\n_Every Invoice has a Voice_\n\n"
-                "Choose your language:\n1️⃣ English\n2️⃣ Telugu / తెలుగు"
-            )
+                if not run_background(process_voice_note, from_num, media_url,
+                                      seller or {"language":"telugu"}, "telugu"):
+                    return msg_twiml("busy", "telugu")
+                return NEW_VOICE_TWIML
+            return WELCOME_TWIML
 
         lang = seller.get("language", "english")
         step = seller.get("onboarding_step", "complete")
@@ -1572,35 +1443,18 @@ def webhook():
         # ── STEP 2: VOICE NOTE — ALWAYS processes, even during onboarding ─────
         # This is the core product — never block it
         if num_media and media_url:
-            t = threading.Thread(
-                target=process_voice_note,
-                args=(from_num, media_url, seller, lang),
-                daemon=True
-            )
-            t.start()
-            return twiml_reply(
-                "🎙️ Voice note received! Processing...\n⏳ Your invoice will arrive in ~30 seconds."
-                if lang == "english"
-                else "🎙️ Voice note అందింది! Process అవుతుంది...\n⏳ Invoice ~30 seconds లో వస్తుంది."
-            )
-
-        # ── STEP 3: "Hi/Hello" — ALWAYS shows language selection first ────────
-        if tl in GREETINGS:
-            # Reset to language selection so user can pick/change language
-            update_seller(from_num, {"onboarding_step": "language_asked"})
-            return twiml_reply(
-                "Welcome to *GutInvoice* 🎙️\n_Every Invoice has a Voice_\n\n"
-                "Choose your language:\n1️⃣ English\n2️⃣ Telugu / తెలుగు"
-            )
+            if not run_background(process_voice_note, from_num, media_url, seller, lang):
+                return msg_twiml("busy", lang)
+            return msg_twiml("voice_ack", lang)
 
-        # ── STEP 4: ONBOARDING (text flow) ───────────────────────────────────
+        # ── STEP 3: ONBOARDING (text flow) ───────────────────────────────────
         if step not in ("complete", None, ""):
             return handle_onboarding(from_num, body, seller)
 
-        # ── STEP 5: MAIN COMMANDS (onboarding complete) ───────────────────────
+        # ── STEP 4: MAIN COMMANDS (onboarding complete) ───────────────────────
 
         # HELP / STATUS
-        if tl in ("help", "హెల్ప్", "status"):
+        if cmd == "help":
             name  = seller.get("business_name") or "Not set"
             gstin = seller.get("gstin") or "Not set"
             addr  = seller.get("address") or "Not set"
@@ -1615,75 +1469,79 @@ def webhook():
             )
 
         # UPDATE / REGISTER
-        if tl in ("update", "register"):
+        if cmd == "update":
             update_seller(from_num, {"onboarding_step": "reg_name"})
-            return twiml_reply(
-                "✏️ Let\'s update your business profile!\n\n"
-                "Enter your *Business Name*:"
-                if lang == "english"
-                else "✏️ మీ business profile update చేద్దాం!\n\n"
-                     "మీ *వ్యాపార పేరు* enter చేయండి:"
-            )
+            return msg_twiml("update", lang)
 
         # CANCEL
         if is_cancel_request(body):
-            t = threading.Thread(
-                target=handle_cancel_request,
-                args=(from_num, body, seller, lang),
-                daemon=True
-            )
-            t.start()
-            return twiml_reply(
-                "⏳ Processing cancellation request..."
-                if lang == "english"
-                else "⏳ Cancellation process అవుతుంది..."
-            )
+            if not run_background(handle_cancel_request, from_num, body, seller, lang):
+                return msg_twiml("busy", lang)
+            return msg_twiml("cancel_ack", lang)
 
         # REPORT
         if is_report_request(body):
-            t = threading.Thread(
-                target=handle_report_request,
-                args=(from_num, body, seller, lang),
-                daemon=True
-            )
-            t.start()
-            return twiml_reply(
-                "📊 Generating your report... (30–60 seconds)"
-                if lang == "english"
-                else "📊 Report తయారవుతుంది... (30-60 seconds)"
-            )
+            # Start the Supabase read now — it doesn't have to wait for a free
+            # EXECUTOR slot behind in-flight voice notes
+            rows = IO_POOL.submit(get_all_monthly_invoices, from_num, *parse_month_year(body))
+            if not run_background(handle_report_request, from_num, body, seller, lang, rows):
+                return msg_twiml("busy", lang)
+            return msg_twiml("report_ack", lang)
 
         # UNKNOWN TEXT — helpful nudge
-        return twiml_reply(
-            "🎙️ Send a *voice note* to create an invoice instantly!\n\n"
-            "Or type:\n• *HI* — Language & menu\n• *HELP* — Your profile\n• *UPDATE* — Edit business details"
-            if lang == "english"
-            else "🎙️ Invoice కోసం *voice note* పంపండి!\n\n"
-                 "లేదా type చేయండి:\n• *HI* — Language & menu\n• *HELP* — Profile\n• *UPDATE* — Business details"
-        )
+        return msg_twiml("nudge", lang)
 
     except Exception as e:
-        log.error(f"Webhook FATAL: {e}", exc_info=True)
-        return twiml_reply("⚠️ Something went wrong. Please try again.")
+        log.error("Webhook FATAL: %s", e, exc_info=True)
+        return msg_twiml("error", lang)
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # HEALTH CHECK
 # ═══════════════════════════════════════════════════════════════════════════════
 
+# Network probes run side by side — wall time is the slowest probe, not the sum
+_PROBE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="gutinvoice-probe")
+
+def run_probes(probes, timeout=5, failed=False):
+    """Run {name: fn} concurrently; a probe that raises or overruns reports `failed`"""
+    futures  = {name: _PROBE_POOL.submit(fn) for name, fn in probes.items()}
+    deadline = time.monotonic() + timeout
+    results  = {}
+    for name, fut in futures.items():
+        try:
+            results[name] = fut.result(timeout=max(0, deadline - time.monotonic()))
+        except Exception:
+            results[name] = failed
+    return results
+
+def _probe_supabase():
+    r = SESSION.get(sb_url("sellers","?limit=1"), headers=sb_h(), timeout=5)
+    return r.status_code == 200
+
+HEALTH_PROBES = {"supabase_connection": _probe_supabase}
+
+WARM_URLS = tuple(u for u in (SUPABASE_URL, "https://api.twilio.com", "https://api.sarvam.ai") if u)
+
+def warm_up():
+    """Build API clients and open pooled TLS connections before the first webhook arrives"""
+    t0 = time.monotonic()
+    for build in (get_claude, get_twilio):
+        try:
+            build()
+        except Exception as e:
+            log.warning("warm_up: %s failed: %s", build.__name__, e)
+    probes = {u: (lambda u=u: SESSION.head(u, timeout=5).status_code) for u in WARM_URLS}
+    log.info("🔥 Warm-up done in %.2fs | %s", time.monotonic() - t0, run_probes(probes, timeout=10))
+
 @app.route("/health")
 def health():
-    keys = ["TWILIO_ACCOUNT_SID","TWILIO_AUTH_TOKEN","TWILIO_FROM_NUMBER","SARVAM_API_KEY","SUPABASE_URL","SUPABASE_KEY"]
-    checks = {k: bool(env(k)) for k in keys}
-    checks["CLAUDE_API_KEY"] = bool(env("CLAUDE_API_KEY") or env("ANTHROPIC_API_KEY"))
-    try:
-        r = requests.get(sb_url("sellers","?limit=1"), headers=sb_h(), timeout=5)
-        checks["supabase_connection"] = (r.status_code==200)
-    except Exception:
-        checks["supabase_connection"] = False
+    checks = {k: bool(v) for k, v in CONFIG.items()}
+    checks.update(run_probes(HEALTH_PROBES))
     ok = all(checks.values())
-    return {"status":"healthy" if ok else "missing_config","version":"v16.1",
-            "checks":checks,"timestamp":datetime.now().isoformat()}, 200 if ok else 500
+    return Response(orjson.dumps({"status":"healthy" if ok else "missing_config","version":"v16.1",
+                                  "checks":checks,"timestamp":datetime.now().isoformat()}),
+                    status=200 if ok else 500, mimetype="application/json")
 
 HOME_HTML = """<!DOCTYPE html>
 <html lang="en">
@@ -1701,14 +1559,65 @@ HOME_HTML = """<!DOCTYPE html>
 <footer>Powered by Tallbag Advisory and Tech Solutions Private Limited · +91 7702424946</footer>
 </body></html>"""
 
+# HOME_HTML has no template variables — serve it as-is, no Jinja parse per hit.
+# Body, gzip body and ETags are all computed once; repeat visits get a 304.
+HOME_BYTES   = HOME_HTML.encode("utf-8")
+HOME_GZIP    = gzip.compress(HOME_BYTES, compresslevel=9, mtime=0)
+HOME_ETAG    = hashlib.md5(HOME_BYTES).hexdigest()
+HOME_ETAG_GZ = HOME_ETAG + "-gz"
+HOME_HEADERS = {"Content-Type": "text/html; charset=utf-8",
+                "Cache-Control": "public, max-age=3600",
+                "Vary": "Accept-Encoding"}
+
 @app.route("/")
 def home():
-    return render_template_string(HOME_HTML)
+    gz   = bool(request.accept_encodings["gzip"])
+    etag = HOME_ETAG_GZ if gz else HOME_ETAG
+    hdrs = {**HOME_HEADERS, "ETag": f'"{etag}"'}
+    if request.if_none_match.contains(etag):
+        return "", 304, hdrs
+    if gz:
+        return HOME_GZIP, 200, {**hdrs, "Content-Encoding": "gzip"}
+    return HOME_BYTES, 200, hdrs
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # DEBUG ENDPOINT — visit https://your-app.railway.app/debug to diagnose
 # ═══════════════════════════════════════════════════════════════════════════════
 
+def _debug_probe(fn):
+    """Wrap a /debug check so an exception becomes its report line"""
+    @wraps(fn)
+    def run():
+        try:
+            return fn()
+        except Exception as e:
+            return f"❌ {e}"
+    return run
+
+@_debug_probe
+def _debug_twilio():
+    acc = get_twilio().api.accounts(TWILIO_SID).fetch()
+    return f"✅ OK — {acc.friendly_name}"
+
+@_debug_probe
+def _debug_sellers():
+    r = SESSION.get(sb_url("sellers","?limit=3"), headers=sb_h(), timeout=5)
+    return f"✅ HTTP {r.status_code} — {r.text[:80]}"
+
+@_debug_probe
+def _debug_invoices():
+    r = SESSION.get(sb_url("invoices","?limit=1"), headers=sb_h(), timeout=5)
+    return f"✅ HTTP {r.status_code} — {r.text[:80]}"
+
+@_debug_probe
+def _debug_sarvam():
+    return f"✅ HTTP {SESSION.get('https://api.sarvam.ai', timeout=5).status_code}"
+
+DEBUG_PROBES = {"twilio_test":       _debug_twilio,
+                "supabase_sellers":  _debug_sellers,
+                "supabase_invoices": _debug_invoices,
+                "sarvam_reachable":  _debug_sarvam}
+
 @app.route("/debug")
 def debug():
     """
@@ -1719,43 +1628,14 @@ def debug():
     results = {}
 
     # 1. Env vars
-    for k in ["TWILIO_ACCOUNT_SID","TWILIO_AUTH_TOKEN","TWILIO_FROM_NUMBER",
-              "SARVAM_API_KEY","SUPABASE_URL","SUPABASE_KEY"]:
-        val = env(k)
+    for k, val in CONFIG.items():
         results[k] = f"SET ({len(val)} chars)" if val else "❌ MISSING"
-    results["CLAUDE_API_KEY"] = f"SET" if (env("CLAUDE_API_KEY") or env("ANTHROPIC_API_KEY")) else "❌ MISSING"
 
-    # 2. Twilio test
-    try:
-        c = get_twilio()
-        acc = c.api.accounts(env("TWILIO_ACCOUNT_SID")).fetch()
-        results["twilio_test"] = f"✅ OK — {acc.friendly_name}"
-    except Exception as e:
-        results["twilio_test"] = f"❌ {e}"
-
-    # 3. Supabase sellers table
-    try:
-        r = requests.get(sb_url("sellers","?limit=3"), headers=sb_h(), timeout=5)
-        results["supabase_sellers"] = f"✅ HTTP {r.status_code} — {r.text[:80]}"
-    except Exception as e:
-        results["supabase_sellers"] = f"❌ {e}"
-
-    # 4. Supabase invoices table
-    try:
-        r = requests.get(sb_url("invoices","?limit=1"), headers=sb_h(), timeout=5)
-        results["supabase_invoices"] = f"✅ HTTP {r.status_code} — {r.text[:80]}"
-    except Exception as e:
-        results["supabase_invoices"] = f"❌ {e}"
-
-    # 5. Sarvam API reachability
-    try:
-        r = requests.get("https://api.sarvam.ai", timeout=5)
-        results["sarvam_reachable"] = f"✅ HTTP {r.status_code}"
-    except Exception as e:
-        results["sarvam_reachable"] = f"❌ {e}"
+    # 2–5. External checks run side by side — page load is the slowest probe, not the sum
+    results.update(run_probes(DEBUG_PROBES, timeout=10, failed="❌ timed out"))
 
     # 6. TWILIO_FROM_NUMBER format
-    fnum = env("TWILIO_FROM_NUMBER","")
+    fnum = TWILIO_FROM
     if fnum.startswith("whatsapp:"):
         results["from_number_format"] = f"✅ Correct format: {fnum}"
     elif fnum:
@@ -1763,6 +1643,12 @@ def debug():
     else:
         results["from_number_format"] = "❌ MISSING"
 
+    # 7. Seller cache effectiveness (this worker only)
+    with _SELLER_LOCK:
+        hits, misses, size = SELLER_CACHE_STATS["hits"], SELLER_CACHE_STATS["misses"], len(SELLER_CACHE)
+    ratio = f"{hits / (hits + misses):.0%}" if hits + misses else "n/a"
+    results["seller_cache"] = f"{hits} hits / {misses} misses ({ratio}), {size} cached"
+
     results["python_version"] = sys.version
     results["app_version"]    = "v16.1"
 
@@ -1781,7 +1667,7 @@ def test_whatsapp():
         return "Add ?to=whatsapp:+91XXXXXXXXXX to the URL", 400
     try:
         get_twilio().messages.create(
-            from_=env("TWILIO_FROM_NUMBER"),
+            from_=TWILIO_FROM,
             to=test_to,
             body="✅ GutInvoice v16.1 is live and working! Your webhook is connected correctly."
         )
@@ -1790,6 +1676,9 @@ def test_whatsapp():
         return f"❌ Failed: {e}", 500
 
 if __name__ == "__main__":
+    # Local development only — production runs the Procfile command:
+    #   gunicorn main:app --workers 2 --worker-class gthread --threads 16
     port = int(env("PORT",5000))
-    log.info(f"🚀 GutInvoice v16.1 starting on port {port}")
-    app.run(host="0.0.0.0", port=port, debug=False)
+    log.info("🚀 GutInvoice v16.1 starting on port %s (dev server)", port)
+    warm_up()
+    app.run(host="0.0.0.0", port=port, debug=False, threaded=True)
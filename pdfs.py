@@ -0,0 +1,806 @@
+"""
+GutInvoice PDF builders — ReportLab layouts for the three invoice formats, the
+credit note and the monthly report.
+
+Imported by main.py and by the PDF render processes, which load only this
+module: keep it free of import-time side effects (no logging setup, threads,
+pools or API clients).
+"""
+
+import io
+from datetime import datetime
+from functools import lru_cache
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.units import mm
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
+from reportlab.platypus import (
+    SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PDF BUILDERS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def fmt(val):
+    """Money: 1,234.50 — ints (most qty/amount fields) skip the float round-trip"""
+    if type(val) is int:
+        return f"{val:,}.00"
+    try:
+        return f"{float(val):,.2f}"
+    except Exception:
+        return "0.00"
+
+def fmt_rs(val):
+    """fmt() with the "Rs. " label, formatted in one step"""
+    if type(val) is int:
+        return f"Rs. {val:,}.00"
+    try:
+        return f"Rs. {float(val):,.2f}"
+    except Exception:
+        return "Rs. 0.00"
+
+def fmt_i(val):
+    """Rate label: 18 not 18.0 — ints and integer strings skip float parsing"""
+    if type(val) is int:
+        return str(val)
+    try:
+        if type(val) is str:
+            try:
+                return str(int(val))
+            except ValueError:
+                pass
+        v = float(val)
+        return str(int(v)) if v == int(v) else str(v)
+    except Exception:
+        return "0"
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PDF STYLES & CONSTANTS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+M      = 15 * mm
+PAGE_W = A4[0] - 2 * M
+TEAL   = colors.HexColor("#006B6B")
+ORANGE = colors.HexColor("#FF6B35")
+DARK   = colors.HexColor("#1A1A2E")
+LGRAY  = colors.HexColor("#F5F5F5")
+RED    = colors.HexColor("#CC0000")
+WHITE  = colors.white
+SS     = getSampleStyleSheet()
+
+# Column widths are fixed fractions of the page — computed once, not per PDF
+_CW_FULL       = (PAGE_W,)
+_CW_ITEMS      = tuple(PAGE_W * w for w in (0.05, 0.33, 0.12, 0.08, 0.08, 0.16, 0.18))
+_CW_TOTALS     = (PAGE_W * 0.70, PAGE_W * 0.30)
+_CW_DECL2      = (PAGE_W * 0.60, PAGE_W * 0.40)
+_CW_SELLER_INV = (PAGE_W * 0.52, PAGE_W * 0.48)
+_CW_SIG        = (PAGE_W * 0.55, PAGE_W * 0.45)
+_CW_CN_REF     = (PAGE_W * 0.55, PAGE_W * 0.45)
+_CW_REPORT_HDR = (PAGE_W * 0.6, PAGE_W * 0.4)
+_CW_KPI        = (PAGE_W / 3,) * 3
+_CW_SECTION    = tuple(PAGE_W * w for w in (0.18, 0.10, 0.17, 0.22, 0.12, 0.07, 0.07, 0.07))
+_CW_HSN        = tuple(PAGE_W * w for w in (0.12, 0.26, 0.15, 0.12, 0.12, 0.12, 0.11))
+_CW_FINAL      = (PAGE_W * 0.72, PAGE_W * 0.28)
+
+def _s(name, **kw):
+    return ParagraphStyle(name=name, parent=SS["Normal"], **kw)
+
+ST = {
+    "doc_title": _s("doc_title", fontSize=15, fontName="Helvetica-Bold",
+                    textColor=WHITE, alignment=TA_CENTER),
+    "sec_hdr":   _s("sec_hdr",  fontSize=8,  fontName="Helvetica-Bold",
+                    textColor=WHITE, alignment=TA_CENTER),
+    "body":      _s("body",     fontSize=8,  textColor=DARK, leading=12),
+    "body_b":    _s("body_b",   fontSize=8,  fontName="Helvetica-Bold", textColor=DARK),
+    "body_r":    _s("body_r",   fontSize=8,  textColor=DARK, alignment=TA_RIGHT, leading=12),
+    "grand_l":   _s("grand_l",  fontSize=9,  fontName="Helvetica-Bold", textColor=DARK),
+    "grand_r":   _s("grand_r",  fontSize=9,  fontName="Helvetica-Bold", textColor=DARK,
+                    alignment=TA_RIGHT),
+    "th":        _s("th",       fontSize=8,  fontName="Helvetica-Bold",
+                    textColor=WHITE, alignment=TA_CENTER),
+    "td_c":      _s("td_c",     fontSize=8,  textColor=DARK, alignment=TA_CENTER, leading=11),
+    "td_l":      _s("td_l",     fontSize=8,  textColor=DARK, alignment=TA_LEFT,   leading=11),
+    "td_r":      _s("td_r",     fontSize=8,  textColor=DARK, alignment=TA_RIGHT,  leading=11),
+    "fn1":       _s("fn1",      fontSize=7,  textColor=WHITE, alignment=TA_CENTER, leading=10),
+    "fn2":       _s("fn2",      fontSize=6,  textColor=ORANGE, alignment=TA_CENTER,
+                    leading=9, fontName="Helvetica-Oblique"),
+    "red_b":     _s("red_b",    fontSize=8,  fontName="Helvetica-Bold", textColor=RED),
+    "red_r":     _s("red_r",    fontSize=8,  fontName="Helvetica-Bold", textColor=RED,
+                    alignment=TA_RIGHT),
+    "small_c":   _s("small_c",  fontSize=7,  textColor=colors.grey,
+                    alignment=TA_CENTER, leading=9),
+}
+
+def p(text, style="body"):
+    return Paragraph(str(text) if text is not None else "", ST[style])
+
+def sp(h=4):
+    return Spacer(1, h * mm)
+
+# Fixed cell text — only the markup is module-level. Paragraph.wrap()/split()
+# store layout state (width, height, blPara) on the instance, so every PDF
+# builds its own Paragraphs; sharing one across concurrent builds could
+# misplace its lines.
+_ITEMS_HEADER   = ("#", "Description", "HSN/SAC", "Qty", "Unit", "Rate (Rs.)", "Amount (Rs.)")
+# Monthly report: section A/B/C/E, HSN (section D) and KPI header rows
+_SECTION_HEADER = ("Invoice No", "Date", "Customer", "Description",
+                   "Taxable Rs.", "CGST Rs.", "SGST Rs.", "IGST Rs.")
+_HSN_HEADER     = ("HSN Code", "Description", "Taxable Rs.", "CGST Rs.",
+                   "SGST Rs.", "IGST Rs.", "Total Tax Rs.")
+_KPI_HEADER     = ("Total Invoices", "Total Taxable Value", "Total GST Payable")
+# Branding footer — (text, style) per row, identical on every document
+_FOOTER_ROWS    = (
+    ("Powered by GutInvoice, Every Invoice has a voice !!", "fn1"),
+    ("Developed by Tallbag Advisory and Tech Solutions Private Limited  |  Contact: +91 7702424946", "fn1"),
+    ("Disclaimer: Double check the Invoice details generated before sharing to anyone. GutInvoice is not responsible for any errors.", "fn2"),
+)
+
+def _header_row(labels, style="th"):
+    return [p(h, style) for h in labels]
+
+# TableStyles are only read during layout — build each once and share it
+# across every PDF instead of re-validating the command lists per call
+_HEADER_STYLE = TableStyle([
+    ("BACKGROUND",    (0, 0), (-1, -1), TEAL),
+    ("VALIGN",        (0, 0), (-1, -1), "MIDDLE"),
+    ("TOPPADDING",    (0, 0), (-1, -1), 0),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
+])
+_BOX_STYLE = TableStyle([
+    ("BACKGROUND",    (0, 0), (-1, 0), TEAL),
+    ("BACKGROUND",    (0, 1), (-1, -1), LGRAY),
+    ("TOPPADDING",    (0, 0), (-1, -1), 3),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 6),
+    ("RIGHTPADDING",  (0, 0), (-1, -1), 6),
+    ("BOX",           (0, 0), (-1, -1), 0.5, colors.lightgrey),
+    ("INNERGRID",     (0, 1), (-1, -1), 0.2, colors.lightgrey),
+])
+_FLUSH_STYLE = TableStyle([
+    ("VALIGN",        (0, 0), (-1, -1), "TOP"),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 0),
+    ("RIGHTPADDING",  (0, 0), (-1, -1), 0),
+    ("TOPPADDING",    (0, 0), (-1, -1), 0),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
+])
+_ITEMS_STYLE = TableStyle([
+    ("BACKGROUND",    (0, 0), (-1, 0), TEAL),
+    ("ROWBACKGROUNDS",(0, 1), (-1, -1), [WHITE, LGRAY]),
+    ("BOX",           (0, 0), (-1, -1), 0.5, colors.lightgrey),
+    ("INNERGRID",     (0, 0), (-1, -1), 0.3, colors.lightgrey),
+    ("VALIGN",        (0, 0), (-1, -1), "MIDDLE"),
+    ("TOPPADDING",    (0, 0), (-1, -1), 3),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
+])
+_TOTALS_STYLE = TableStyle([
+    ("TOPPADDING",    (0, 0), (-1, -1), 3),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 5),
+    ("RIGHTPADDING",  (0, 0), (-1, -1), 5),
+    ("ALIGN",         (1, 0), (1, -1), "RIGHT"),
+    ("LINEABOVE",     (0, -1), (-1, -1), 1.2, TEAL),
+    ("LINEBELOW",     (0, -1), (-1, -1), 1.5, TEAL),
+    ("BACKGROUND",    (0, -1), (-1, -1), LGRAY),
+])
+_DECL2_STYLE = TableStyle([
+    ("BOX",           (0, 0), (-1, -1), 0.5, colors.lightgrey),
+    ("BACKGROUND",    (0, 0), (-1, 0), LGRAY),
+    ("INNERGRID",     (0, 0), (-1, -1), 0.3, colors.lightgrey),
+    ("TOPPADDING",    (0, 0), (-1, -1), 4),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 6),
+    ("VALIGN",        (0, 0), (-1, -1), "TOP"),
+])
+_DECL1_STYLE = TableStyle([
+    ("BOX",           (0, 0), (-1, -1), 0.5, colors.lightgrey),
+    ("BACKGROUND",    (0, 0), (-1, 0), LGRAY),
+    ("TOPPADDING",    (0, 0), (-1, -1), 4),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 6),
+])
+_SIG1_STYLE = TableStyle([
+    ("TOPPADDING",    (0, 0), (-1, -1), 14),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+    ("ALIGN",         (1, 0), (1, 0), "RIGHT"),
+])
+_SIG2_STYLE = TableStyle([
+    ("TOPPADDING",    (0, 0), (-1, -1), 2),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
+    ("ALIGN",         (1, 0), (1, 0), "RIGHT"),
+    ("LINEABOVE",     (1, 0), (1, 0), 0.5, colors.lightgrey),
+])
+_FOOTER_STYLE = TableStyle([
+    ("BACKGROUND",    (0, 0), (0, 1), TEAL),
+    ("BACKGROUND",    (0, 2), (0, 2), colors.HexColor("#FFF3EE")),
+    ("TOPPADDING",    (0, 0), (-1, -1), 3),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
+    ("BOX",           (0, 2), (-1, 2), 0.3, ORANGE),
+])
+_CN_REF_STYLE = TableStyle([
+    ("BOX",           (0, 0), (-1, -1), 0.8, TEAL),
+    ("BACKGROUND",    (0, 0), (-1, -1), colors.HexColor("#E8F5F5")),
+    ("INNERGRID",     (0, 0), (-1, -1), 0.2, colors.lightgrey),
+    ("TOPPADDING",    (0, 0), (-1, -1), 4),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
+    ("LEFTPADDING",   (0, 0), (-1, -1), 6),
+])
+_KPI_STYLE = TableStyle([
+    ("BACKGROUND",    (0,0),(-1,0), TEAL),
+    ("BACKGROUND",    (0,1),(-1,1), LGRAY),
+    ("BOX",           (0,0),(-1,-1), 0.8, TEAL),
+    ("INNERGRID",     (0,0),(-1,-1), 0.5, colors.lightgrey),
+    ("TOPPADDING",    (0,0),(-1,-1), 5),
+    ("BOTTOMPADDING", (0,0),(-1,-1), 5),
+    ("LEFTPADDING",   (0,0),(-1,-1), 8),
+    ("VALIGN",        (0,0),(-1,-1), "MIDDLE"),
+])
+# Report ledgers (sections A/B/C/E and the HSN table): teal header row,
+# zebra body, bold grey TOTAL row
+_SECTION_STYLE = TableStyle([
+    ("BACKGROUND",    (0,0),(-1,0),  TEAL),
+    ("BACKGROUND",    (0,-1),(-1,-1), LGRAY),
+    ("ROWBACKGROUNDS",(0,1),(-1,-2), [WHITE, colors.HexColor("#F9F9F9")]),
+    ("BOX",           (0,0),(-1,-1),  0.5, colors.lightgrey),
+    ("INNERGRID",     (0,0),(-1,-1),  0.3, colors.lightgrey),
+    ("FONTNAME",      (0,-1),(-1,-1), "Helvetica-Bold"),
+    ("TOPPADDING",    (0,0),(-1,-1),  3),
+    ("BOTTOMPADDING", (0,0),(-1,-1),  3),
+    ("VALIGN",        (0,0),(-1,-1),  "MIDDLE"),
+])
+_HSN_STYLE = _SECTION_STYLE
+_FINAL_STYLE = TableStyle([
+    ("BOX",           (0,0),(-1,-1), 0.8, TEAL),
+    ("BACKGROUND",    (0,-1),(-1,-1), colors.HexColor("#E8F5F5")),
+    ("LINEABOVE",     (0,-1),(-1,-1), 1.5, TEAL),
+    ("INNERGRID",     (0,0),(-1,-2), 0.3, colors.lightgrey),
+    ("TOPPADDING",    (0,0),(-1,-1), 4),
+    ("BOTTOMPADDING", (0,0),(-1,-1), 4),
+    ("LEFTPADDING",   (0,0),(-1,-1), 6),
+    ("RIGHTPADDING",  (0,0),(-1,-1), 6),
+    ("ALIGN",         (1,0),(1,-1),  "RIGHT"),
+])
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PDF SHARED COMPONENTS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def doc_header(title):
+    """Full-width teal header — centered bold title"""
+    t = Table([[p(title, "doc_title")]], colWidths=_CW_FULL, rowHeights=[11 * mm])
+    t.setStyle(_HEADER_STYLE)
+    return t
+
+def _inner_box(rows, width):
+    t = Table(rows, colWidths=[width])
+    t.setStyle(_BOX_STYLE)
+    return t
+
+def seller_invoice_section(d, today, show_gstin=True, show_reverse=True,
+                            right_lbl="INVOICE DETAILS", no_lbl="Invoice No"):
+    """
+    Two-column block matching all docx templates:
+    Left  = SELLER DETAILS
+    Right = INVOICE DETAILS (or CREDIT NOTE DETAILS)
+    """
+    LW, RW = _CW_SELLER_INV
+
+    left_rows = [
+        [p("SELLER DETAILS", "sec_hdr")],
+        [p(f"<b>Business Name:</b> {d.get('seller_name','')}", "body")],
+        [p(f"<b>Address:</b> {d.get('seller_address','')}", "body")],
+    ]
+    if show_gstin:
+        left_rows.append([p(f"<b>GSTIN:</b> {d.get('seller_gstin','')}", "body")])
+
+    inv_date_lbl = "Credit Note Date" if "CREDIT" in right_lbl.upper() else "Invoice Date"
+    right_rows = [
+        [p(right_lbl, "sec_hdr")],
+        [p(f"<b>{no_lbl}:</b> {d.get('invoice_number','')}", "body")],
+        [p(f"<b>{inv_date_lbl}:</b> {d.get('invoice_date') or today}", "body")],
+        [p(f"<b>Place of Supply:</b> {d.get('place_of_supply','')}", "body")],
+    ]
+    if show_reverse:
+        right_rows.append([p(f"<b>Reverse Charge:</b> {d.get('reverse_charge','No')}", "body")])
+
+    outer = Table(
+        [[_inner_box(left_rows, LW - 3), _inner_box(right_rows, RW - 3)]],
+        colWidths=_CW_SELLER_INV
+    )
+    outer.setStyle(_FLUSH_STYLE)
+    return outer
+
+def bill_to_section(d, show_gstin=True):
+    """Full-width BILL TO box"""
+    rows = [
+        [p("BILL TO (CUSTOMER DETAILS)", "sec_hdr")],
+        [p(f"<b>Name:</b> {d.get('customer_name','')}", "body")],
+        [p(f"<b>Address:</b> {d.get('customer_address','')}", "body")],
+    ]
+    if show_gstin and d.get("customer_gstin"):
+        rows.append([p(f"<b>GSTIN:</b> {d.get('customer_gstin','')}", "body")])
+    t = Table(rows, colWidths=_CW_FULL)
+    t.setStyle(_BOX_STYLE)
+    return t
+
+def items_table_7col(items):
+    """
+    7-column items table matching all 3 docx templates:
+    # | Description | HSN/SAC | Qty | Unit | Rate (Rs.) | Amount (Rs.)
+    """
+    P, td_c, td_l, td_r = Paragraph, ST["td_c"], ST["td_l"], ST["td_r"]   # hot loop: bind locals
+    data = [_header_row(_ITEMS_HEADER)]
+    data.extend(
+        [P(str(it.get("sno","1")),            td_c),
+         P(str(it.get("description","")),     td_l),
+         P(str(it.get("hsn_sac","")),         td_c),
+         P(fmt(it.get("qty", 0)),             td_r),
+         P(str(it.get("unit","Nos")),         td_c),
+         P(fmt_rs(it.get("rate",0)),          td_r),
+         P(fmt_rs(it.get("amount",0)),        td_r)]
+        for it in items
+    )
+    t = Table(data, colWidths=_CW_ITEMS, repeatRows=1)
+    t.setStyle(_ITEMS_STYLE)
+    return t
+
+def totals_box(rows):
+    """Right-aligned totals block with grand total highlighted"""
+    t = Table(rows, colWidths=_CW_TOTALS)
+    t.setStyle(_TOTALS_STYLE)
+    return t
+
+def declaration_two_col(declaration, payment_terms):
+    """Two-column DECLARATION | PAYMENT TERMS — used in Tax Invoice"""
+    t = Table(
+        [[p("<b>DECLARATION</b>", "body_b"), p("<b>PAYMENT TERMS</b>", "body_b")],
+         [p(declaration, "body"),            p(payment_terms, "body")]],
+        colWidths=_CW_DECL2
+    )
+    t.setStyle(_DECL2_STYLE)
+    return t
+
+def declaration_single(title, declaration, payment_terms):
+    """Single-box declaration — used in Bill of Supply and Non-GST Invoice"""
+    t = Table(
+        [[p(title, "body_b")],
+         [p(declaration, "body")],
+         [p(f"<b>Payment Terms:</b> {payment_terms}", "body")]],
+        colWidths=_CW_FULL
+    )
+    t.setStyle(_DECL1_STYLE)
+    return t
+
+def signatory_block(seller_name):
+    """For {seller} / Authorised Signatory — right aligned"""
+    t1 = Table(
+        [[p(""), p(f"<b>For {seller_name}</b>", "body")]],
+        colWidths=_CW_SIG
+    )
+    t1.setStyle(_SIG1_STYLE)
+    t2 = Table(
+        [[p(""), p("Authorised Signatory", "body")]],
+        colWidths=_CW_SIG
+    )
+    t2.setStyle(_SIG2_STYLE)
+    return [t1, t2]
+
+def footer_elems():
+    t = Table([[p(text, style)] for text, style in _FOOTER_ROWS], colWidths=_CW_FULL)
+    t.setStyle(_FOOTER_STYLE)
+    return [sp(5), t]
+
+_ONES = ("", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine",
+         "Ten", "Eleven", "Twelve", "Thirteen", "Fourteen", "Fifteen", "Sixteen",
+         "Seventeen", "Eighteen", "Nineteen")
+_TENS = ("", "", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety")
+_CRORE = 10_000_000
+
+def _two_digits(n):
+    if n < 20:
+        return _ONES[n]
+    return _TENS[n // 10] + (" " + _ONES[n % 10] if n % 10 else "")
+
+def _below_crore(n, out):
+    """Append Indian-system words for 0 < n < 1 crore: lakh, thousand, hundred, rest"""
+    for value, name in ((100_000, "Lakh"), (1_000, "Thousand")):
+        q, n = divmod(n, value)
+        if q:
+            out += (_two_digits(q), name)
+    h, r = divmod(n, 100)
+    if h:
+        out += (_ONES[h], "Hundred")
+        if r:
+            out += ("and", _two_digits(r))
+    elif r:
+        out.append(_two_digits(r))
+
+@lru_cache(maxsize=4096)
+def _rupee_words(n):
+    if n < 0:
+        raise ValueError(f"negative amount: {n}")
+    groups = []                       # base-crore digits, least significant first
+    while n:
+        n, g = divmod(n, _CRORE)
+        groups.append(g)
+    out = []
+    for i in range(len(groups) - 1, -1, -1):
+        if groups[i]:
+            _below_crore(groups[i], out)
+        if i:
+            out.append("Crore")
+    return " ".join(out) + " Rupees Only" if out else "Zero Rupees Only"
+
+def num_words(amount):
+    try:
+        return _rupee_words(int(float(amount)))
+    except Exception:
+        return ""
+
+def is_interstate(d):
+    """Claude returns a JSON bool; rows read back from Supabase may carry "true"/"false" strings"""
+    v = d.get("is_interstate")
+    return v is True or str(v).lower() == "true"
+
+def _rewound(buf):
+    """Hand back the rendered buffer itself (no getvalue() copy), ready to stream"""
+    buf.seek(0)
+    return buf
+
+_DOC_KW = {"pagesize": A4, "leftMargin": M, "rightMargin": M, "topMargin": M, "bottomMargin": M}
+
+def _new_doc(buf):
+    return SimpleDocTemplate(buf, **_DOC_KW)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BUILDER 1: TAX INVOICE  (matches 438394e... docx template)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def build_tax_invoice(d: dict) -> io.BytesIO:
+    buf = io.BytesIO()
+    doc = _new_doc(buf)
+    el  = []
+    total = d.get("total_amount", 0)   # printed in figures and in words
+    today = datetime.now().strftime("%d/%m/%Y")
+
+    el.append(doc_header("TAX INVOICE"))
+    el.append(sp(2))
+    el.append(seller_invoice_section(d, today, show_gstin=True, show_reverse=True))
+    el.append(sp(2))
+    el.append(bill_to_section(d, show_gstin=True))
+    el.append(sp(3))
+    el.append(items_table_7col(d.get("items", [])))
+    el.append(sp(2))
+
+    tr = [[p("Taxable Value","body"), p(f"Rs. {fmt(d.get('taxable_value',0))}","body_r")]]
+    if is_interstate(d):
+        ir = float(d.get("igst_rate", 0))
+        tr.append([p(f"IGST @ {fmt_i(ir)}%","body"), p(f"Rs. {fmt(d.get('igst',0))}","body_r")])
+    else:
+        cr = float(d.get("cgst_rate", 0))
+        sr = float(d.get("sgst_rate", 0))
+        tr.append([p(f"CGST @ {fmt_i(cr)}%","body"), p(f"Rs. {fmt(d.get('cgst',0))}","body_r")])
+        tr.append([p(f"SGST @ {fmt_i(sr)}%","body"), p(f"Rs. {fmt(d.get('sgst',0))}","body_r")])
+    tr.append([p("GRAND TOTAL","grand_l"), p(f"Rs. {fmt(total)}","grand_r")])
+    el.append(totals_box(tr))
+    el.append(sp(2))
+    el.append(p(f"<b>Amount in Words:</b> {num_words(total)}", "body"))
+    el.append(sp(3))
+    el.append(declaration_two_col(
+        d.get("declaration","We declare that this invoice shows the actual price of the goods/services described and all particulars are true and correct."),
+        d.get("payment_terms","Pay within 30 days")
+    ))
+    el.append(sp(2))
+    el.extend(signatory_block(d.get("seller_name","")))
+    el.extend(footer_elems())
+    doc.build(el)
+    return _rewound(buf)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BUILDER 2: BILL OF SUPPLY  (matches 84a93a7... docx template)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def build_bill_of_supply(d: dict) -> io.BytesIO:
+    buf = io.BytesIO()
+    doc = _new_doc(buf)
+    el  = []
+    total = d.get("total_amount", 0)   # printed in figures and in words
+    today = datetime.now().strftime("%d/%m/%Y")
+
+    el.append(doc_header("BILL OF SUPPLY"))
+    el.append(sp(2))
+    el.append(seller_invoice_section(d, today, show_gstin=True, show_reverse=True))
+    el.append(sp(2))
+    el.append(bill_to_section(d, show_gstin=False))   # No GSTIN for BOS customer
+    el.append(sp(3))
+    el.append(items_table_7col(d.get("items", [])))
+    el.append(sp(2))
+    tr = [
+        [p("Sub Total","body"),    p(f"Rs. {fmt(d.get('taxable_value',0))}","body_r")],
+        [p("GRAND TOTAL","grand_l"), p(f"Rs. {fmt(total)}","grand_r")],
+    ]
+    el.append(totals_box(tr))
+    el.append(sp(2))
+    el.append(p(f"<b>Amount in Words:</b> {num_words(total)}", "body"))
+    el.append(sp(3))
+    el.append(declaration_single(
+        "DECLARATION (MANDATORY FOR COMPOSITION DEALERS)",
+        d.get("declaration","Composition taxable person, not eligible to collect tax on supplies."),
+        d.get("payment_terms","Pay within 15 days")
+    ))
+    el.append(sp(2))
+    el.extend(signatory_block(d.get("seller_name","")))
+    el.extend(footer_elems())
+    doc.build(el)
+    return _rewound(buf)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BUILDER 3: INVOICE (Non-GST)  (matches 94ecfd8... docx template)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def build_nongst_invoice(d: dict) -> io.BytesIO:
+    buf = io.BytesIO()
+    doc = _new_doc(buf)
+    el  = []
+    total = d.get("total_amount", 0)   # printed in figures and in words
+    today = datetime.now().strftime("%d/%m/%Y")
+
+    el.append(doc_header("INVOICE"))
+    el.append(sp(2))
+    el.append(seller_invoice_section(d, today, show_gstin=False, show_reverse=False))  # No GSTIN/RC
+    el.append(sp(2))
+    el.append(bill_to_section(d, show_gstin=False))
+    el.append(sp(3))
+    el.append(items_table_7col(d.get("items", [])))
+    el.append(sp(2))
+    tr = [
+        [p("Sub Total","body"),       p(f"Rs. {fmt(d.get('taxable_value',0))}","body_r")],
+        [p("TOTAL AMOUNT","grand_l"), p(f"Rs. {fmt(total)}","grand_r")],
+    ]
+    el.append(totals_box(tr))
+    el.append(sp(2))
+    el.append(p(f"<b>Amount in Words:</b> {num_words(total)}", "body"))
+    el.append(sp(3))
+    el.append(declaration_single(
+        "DECLARATION",
+        d.get("declaration","This is not a tax invoice. No GST has been charged."),
+        d.get("payment_terms","Pay within 30 days")
+    ))
+    el.append(sp(2))
+    el.extend(signatory_block(d.get("seller_name","")))
+    el.extend(footer_elems())
+    doc.build(el)
+    return _rewound(buf)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BUILDER 4: CREDIT NOTE  (matches sample_credit_note_v13.pdf)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def build_credit_note(d: dict) -> io.BytesIO:
+    buf = io.BytesIO()
+    doc = _new_doc(buf)
+    el  = []
+    total = d.get("total_amount", 0)   # printed in figures and in words
+    today = datetime.now().strftime("%d/%m/%Y")
+
+    el.append(doc_header("CREDIT NOTE"))
+    el.append(sp(2))
+
+    # Reference block (top summary — unique to credit notes)
+    cn_no     = d.get("invoice_number") or d.get("credit_note_number","")
+    cn_date   = d.get("invoice_date") or today
+    orig_no   = d.get("original_invoice_number","")
+    orig_date = d.get("original_invoice_date","")
+    reason    = d.get("reason") or d.get("credit_reason","Cancellation of invoice as requested by seller")
+
+    ref = Table(
+        [[p(f"<b>Credit Note No:</b> {cn_no}",    "body"),
+          p(f"<b>Credit Note Date:</b> {cn_date}", "body")],
+         [p(f"<b>Against Invoice No:</b> {orig_no}",       "body"),
+          p(f"<b>Original Invoice Date:</b> {orig_date}",  "body")],
+         [p(f"<b>Reason:</b> {reason}", "body"), p("","body")]],
+        colWidths=_CW_CN_REF
+    )
+    ref.setStyle(_CN_REF_STYLE)
+    el.append(ref)
+    el.append(sp(2))
+
+    el.append(seller_invoice_section(
+        d, today, show_gstin=True, show_reverse=False,
+        right_lbl="CREDIT NOTE DETAILS", no_lbl="Credit Note No"
+    ))
+    el.append(sp(2))
+    el.append(bill_to_section(d, show_gstin=True))
+    el.append(sp(3))
+    el.append(items_table_7col(d.get("items", [])))
+    el.append(sp(2))
+
+    tr    = [[p("Taxable Value Reversed","body"),
+              p(f"Rs. {fmt(d.get('taxable_value',0))}","body_r")]]
+    if is_interstate(d):
+        ir = float(d.get("igst_rate", 0))
+        tr.append([p(f"IGST @ {fmt_i(ir)}% (Reversed)","red_b"),
+                   p(f"(Rs. {fmt(d.get('igst',0))})","red_r")])
+    else:
+        cr = float(d.get("cgst_rate", 0))
+        sr = float(d.get("sgst_rate", 0))
+        tr.append([p(f"CGST @ {fmt_i(cr)}% (Reversed)","red_b"),
+                   p(f"(Rs. {fmt(d.get('cgst',0))})","red_r")])
+        tr.append([p(f"SGST @ {fmt_i(sr)}% (Reversed)","red_b"),
+                   p(f"(Rs. {fmt(d.get('sgst',0))})","red_r")])
+    tr.append([p("TOTAL CREDIT AMOUNT","grand_l"),
+               p(f"Rs. {fmt(total)}","grand_r")])
+    el.append(totals_box(tr))
+    el.append(sp(2))
+    el.append(p(f"<b>Amount in Words:</b> {num_words(total)}", "body"))
+    el.append(sp(3))
+
+    decl_text = d.get("declaration",
+        "This Credit Note cancels and fully reverses the above mentioned invoice. "
+        "The tax liability has been reduced accordingly. This document is valid for "
+        "GST credit note purposes under Section 34 of CGST Act 2017.")
+    decl_t = Table(
+        [[p("DECLARATION","body_b")],
+         [p(decl_text,"body")],
+         [p(f"<b>Original Invoice:</b> {orig_no}  |  <b>Reason:</b> {reason}","body")]],
+        colWidths=_CW_FULL
+    )
+    decl_t.setStyle(_DECL1_STYLE)
+    el.append(decl_t)
+    el.append(sp(2))
+    el.extend(signatory_block(d.get("seller_name","")))
+    el.extend(footer_elems())
+    doc.build(el)
+    return _rewound(buf)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BUILDER 5: MONTHLY REPORT  (matches sample_monthly_report_v13.pdf)
+# 5 Sections + Final Tax Liability Summary
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _section_flowables(section_title, inv_list):
+    """Report section A/B/C/E — a pure function of its rows, returns its flowables"""
+    el = []
+    el.append(p(f"<b>{section_title}</b>","body_b"))
+    el.append(sp(1))
+    if not inv_list:
+        el.append(Table([[p("No invoices in this category.","body")]],
+                        colWidths=_CW_FULL))
+        el.append(sp(3))
+        return el
+    rows = [_header_row(_SECTION_HEADER)]
+    # (taxable, cgst, sgst, igst) per invoice — rows come from _parse_row, so
+    # these are floats already; used for the row and the totals
+    money = [(inv.get("taxable_value",0), inv.get("cgst",0),
+              inv.get("sgst",0), inv.get("igst",0)) for inv in inv_list]
+    for inv, (tax, cgst, sgst, igst) in zip(inv_list, money):
+        d_   = inv.get("_data",{})
+        desc = d_.get("items",[{}])[0].get("description","") if d_.get("items") else ""
+        rows.append([
+            p(inv.get("invoice_number",""),"td_l"),
+            p(inv.get("invoice_date",""),  "td_c"),
+            p(inv.get("customer_name",""), "td_l"),
+            p(desc,                        "td_l"),
+            p(fmt(tax), "td_r"),
+            p(fmt(cgst),"td_r"),
+            p(fmt(sgst),"td_r"),
+            p(fmt(igst),"td_r"),
+        ])
+    rows.append([p(f"TOTAL ({len(inv_list)} invoices)","td_l"), p("","td_c"), p("","td_l"), p("","td_l")]
+                + [p(fmt(sum(col)),"td_r") for col in zip(*money)])
+    t = Table(rows, colWidths=_CW_SECTION, repeatRows=1)
+    t.setStyle(_SECTION_STYLE)
+    el.append(t)
+    el.append(sp(3))
+    return el
+
+def build_monthly_report(rep: dict) -> io.BytesIO:
+    buf = io.BytesIO()
+    doc = _new_doc(buf)
+    el  = []
+
+    now   = datetime.now()
+    month = rep.get("report_month","")
+    year  = rep.get("report_year") or now.year
+    el.append(doc_header(f"Invoice & Tax Liability Report — {month} {year}"))
+    el.append(sp(2))
+
+    # Seller header line
+    sname  = rep.get("seller_name","")
+    sgstin = rep.get("seller_gstin","")
+    saddr  = rep.get("seller_address","")
+    gdate  = now.strftime("%d/%m/%Y")
+    el.append(Table(
+        [[p(f"<b>{sname}</b>  |  {saddr}","body"),
+          p(f"<b>GSTIN:</b> {sgstin}  |  <b>Generated:</b> {gdate}","body_r")]],
+        colWidths=_CW_REPORT_HDR
+    ))
+    el.append(sp(2))
+
+    # KPI Summary box
+    s = rep.get("summary",{})
+    kpi = Table(
+        [_header_row(_KPI_HEADER, "sec_hdr"),
+         [p(str(s.get("total_invoices",0)),"grand_l"),
+          p(f"Rs. {fmt(s.get('taxable_value',0))}","grand_l"),
+          p(f"Rs. {fmt(s.get('total_gst',0))}","grand_l")]],
+        colWidths=_CW_KPI
+    )
+    kpi.setStyle(_KPI_STYLE)
+    el.append(kpi)
+    el.append(sp(4))
+
+    el.extend(_section_flowables("SECTION A — TAX INVOICES (GST Registered)", rep.get("tax_invoices",[])))
+    el.extend(_section_flowables("SECTION B — BILL OF SUPPLY (Composition / Exempt)", rep.get("bos_invoices",[])))
+    el.extend(_section_flowables("SECTION C — NON-GST INVOICES (Unregistered)", rep.get("nongst_invoices",[])))
+
+    # Section D — HSN-WISE TAX SUMMARY
+    el.append(p("<b>SECTION D — HSN-WISE TAX SUMMARY</b>","body_b"))
+    el.append(sp(1))
+    hsn_list = rep.get("hsn_summary",[])
+    if hsn_list:
+        rows2 = [_header_row(_HSN_HEADER)]
+        # (taxable, cgst, sgst, igst, total tax) per HSN — coerced once for row + grand total
+        money = []
+        for h in hsn_list:
+            cgst, sgst, igst = float(h.get("cgst",0)), float(h.get("sgst",0)), float(h.get("igst",0))
+            money.append((float(h.get("taxable",0)), cgst, sgst, igst, cgst+sgst+igst))
+        for h, vals in zip(hsn_list, money):
+            rows2.append([p(str(h.get("hsn","")),"td_c"), p(str(h.get("description","")),"td_l")]
+                         + [p(fmt(v),"td_r") for v in vals])
+        rows2.append([p("GRAND TOTAL","td_l"), p("","td_l")]
+                     + [p(fmt(sum(col)),"td_r") for col in zip(*money)])
+        ht = Table(rows2, colWidths=_CW_HSN, repeatRows=1)
+        ht.setStyle(_HSN_STYLE)
+        el.append(ht)
+    else:
+        el.append(Table([[p("No HSN/SAC data available.","body")]],colWidths=_CW_FULL))
+    el.append(sp(3))
+
+    el.extend(_section_flowables("SECTION E — CREDIT NOTES (Cancelled Invoices)", rep.get("credit_notes",[])))
+
+    # FINAL TAX LIABILITY SUMMARY
+    el.append(p("<b>FINAL TAX LIABILITY SUMMARY</b>","body_b"))
+    el.append(sp(1))
+    fs = rep.get("final_summary",{})
+    fs_rows = [
+        [p("Gross Taxable Value (all invoices)","body"),
+         p(f"Rs. {fmt(fs.get('gross_taxable',0))}","body_r")],
+        [p("Gross CGST Collected","body"),
+         p(f"Rs. {fmt(fs.get('gross_cgst',0))}","body_r")],
+        [p("Gross SGST Collected","body"),
+         p(f"Rs. {fmt(fs.get('gross_sgst',0))}","body_r")],
+        [p("Gross IGST Collected","body"),
+         p(f"Rs. {fmt(fs.get('gross_igst',0))}","body_r")],
+        [p("Less: CGST Reversed (Credit Notes)","red_b"),
+         p(f"(Rs. {fmt(fs.get('reversed_cgst',0))})","red_r")],
+        [p("Less: SGST Reversed (Credit Notes)","red_b"),
+         p(f"(Rs. {fmt(fs.get('reversed_sgst',0))})","red_r")],
+        [p("Less: IGST Reversed (Credit Notes)","red_b"),
+         p(f"(Rs. {fmt(fs.get('reversed_igst',0))})","red_r")],
+        [p("NET GST PAYABLE TO GOVERNMENT ★","grand_l"),
+         p(f"Rs. {fmt(fs.get('net_gst',0))}","grand_r")],
+    ]
+    ft = Table(fs_rows, colWidths=_CW_FINAL)
+    ft.setStyle(_FINAL_STYLE)
+    el.append(ft)
+    el.append(sp(3))
+    el.append(p("Use this report to prepare your GSTR-1 filing. "
+                "Verify all amounts with your Chartered Accountant before submission.","small_c"))
+    el.extend(footer_elems())
+    doc.build(el)
+    return _rewound(buf)
+
+PDF_BUILDERS = {
+    "tax_invoice":    build_tax_invoice,
+    "bill_of_supply": build_bill_of_supply,
+    "nongst_invoice": build_nongst_invoice,
+    "credit_note":    build_credit_note,
+    "monthly_report": build_monthly_report,
+}
+
+def render(builder, d):
+    """Process-pool entry point — returns plain bytes (cheap to pickle back)"""
+    return PDF_BUILDERS[builder](d).getvalue()